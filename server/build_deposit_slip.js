@@ -1,6 +1,6 @@
 import { readFile, readdir } from 'fs/promises';
 import { resolve } from 'path';
-import { buildDepositSlipPdf, extractChecksFromImages, extractChecksFromPdf } from './depositSlip.js';
+import { buildDepositSlipPdf, extractChecksFromImages, extractChecksFromPdf, stopOcrWorker } from './depositSlip.js';
 
 const getArgValue = (args, flag) => {
     const index = args.indexOf(flag);
@@ -94,7 +94,9 @@ const run = async () => {
     console.log(`Created deposit slip: ${outputPath}`);
 };
 
-run().catch((error) => {
-    console.error('Deposit slip build failed:', error.message);
-    process.exit(1);
-});
+run()
+    .catch((error) => {
+        console.error('Deposit slip build failed:', error.message);
+        process.exitCode = 1;
+    })
+    .finally(stopOcrWorker);
@@ -1,50 +1,13 @@
-import { execFile } from 'child_process';
+import { execFile, spawn } from 'child_process';
+import { createInterface } from 'readline';
 import { promisify } from 'util';
-import { mkdir, readdir, readFile, rm, writeFile } from 'fs/promises';
+import { mkdir, mkdtemp, readdir, readFile, rm, writeFile } from 'fs/promises';
 import { join, basename, dirname } from 'path';
 import { tmpdir } from 'os';
 import { PDFDocument, StandardFonts, rgb } from 'pdf-lib';
 
 const execFileAsync = promisify(execFile);
 
-const extractJsonPayload = (stdout) => {
-    const text = stdout.trim();
-    if (!text) {
-        throw new Error('OCR output missing JSON payload.');
-    }
-
-    const objects = [];
-    let depth = 0;
-    let start = -1;
-    for (let i = 0; i < text.length; i += 1) {
-        const char = text[i];
-        if (char === '{') {
-            if (depth === 0) {
-                start = i;
-            }
-            depth += 1;
-        } else if (char === '}') {
-            if (depth > 0) {
-                depth -= 1;
-                if (depth === 0 && start !== -1) {
-                    objects.push(text.slice(start, i + 1));
-                    start = -1;
-                }
-            }
-        }
-    }
-
-    for (let i = objects.length - 1; i >= 0; i -= 1) {
-        try {
-            return JSON.parse(objects[i]);
-        } catch {
-            // Try earlier candidates.
-        }
-    }
-
-    throw new Error('OCR output is not valid JSON.');
-};
-
 const runCommand = async (command, args, options = {}) => {
     try {
         const result = await execFileAsync(command, args, {
@@ -112,8 +75,32 @@ export const convertPdfToImages = async (pdfPath, outputDir) => {
         .sort((a, b) => a.localeCompare(b, undefined, { numeric: true }));
 };
 
-const ocrImageLines = async (
-    imagePath,
+const OCR_WORKER_ENABLED = process.env.OCR_WORKER !== '0';
+const OCR_WORKER_TIMEOUT_MS = Number(process.env.OCR_WORKER_TIMEOUT_MS) || 10 * 60 * 1000;
+const OCR_WORKER_HEALTH_TIMEOUT_MS = 5000;
+// Rasterize PDFs inside the OCR process (pypdfium2) instead of pdftoppm; turned off after the first failure.
+let ocrPdfDirect = process.env.OCR_PDF_DIRECT !== '0';
+const OCR_WORKER_IDLE_CHECK_MS = 60 * 1000;
+
+let ocrWorker = null;
+
+const resolvePythonCommand = async () => {
+    const pythonCommand = process.platform === 'win32' ? 'python' : 'python3';
+    try {
+        await ensureCommand(pythonCommand);
+    } catch {
+        if (process.platform === 'win32') {
+            await ensureCommand('py');
+        } else {
+            throw new Error('Python is required to run OCR.');
+        }
+    }
+    return process.platform === 'win32' ? (await ensureCommand('python').then(() => 'python').catch(() => 'py')) : pythonCommand;
+};
+
+const getOcrScriptPath = () => join(process.cwd(), 'server', 'ocr', 'handwriting_ocr.py');
+
+const buildOcrEnv = ({
     regions = DEFAULT_OCR_REGIONS,
     engines = [],
     regionOrigin = 'top-left',
@@ -123,53 +110,311 @@ const ocrImageLines = async (
     cropMaxSize = '',
     previewOnly = false,
     alignConfig = {}
-) => {
-    const pythonCommand = process.platform === 'win32' ? 'python' : 'python3';
-    try {
-        await ensureCommand(pythonCommand);
-    } catch {
-        if (process.platform === 'win32') {
-            await ensureCommand('py');
-        } else {
-            throw new Error('Python is required to run OCR.');
+} = {}) => ({
+    OCR_REGIONS: JSON.stringify(regions || {}),
+    OCR_ENGINES: JSON.stringify(engines || []),
+    OCR_REGION_ORIGIN: regionOrigin || 'top-left',
+    OCR_REGION_ANCHOR: regionAnchor || 'none',
+    OCR_DEBUG_IMAGES: includePreviews ? '1' : '0',
+    OCR_TROCR_MODEL: ocrModel || '',
+    OCR_CROP_MAX_SIZE: cropMaxSize ? String(cropMaxSize) : '',
+    OCR_PREVIEW_ONLY: previewOnly ? '1' : '0',
+    OCR_ALIGN: alignConfig?.enabled ? '1' : '0',
+    OCR_BOUNDS_PADDING: alignConfig?.boundsPadding != null ? String(alignConfig.boundsPadding) : '',
+    OCR_DESKEW_MAX_ANGLE: alignConfig?.deskewMaxAngle != null ? String(alignConfig.deskewMaxAngle) : '',
+    OCR_DESKEW_STEP: alignConfig?.deskewStep != null ? String(alignConfig.deskewStep) : '',
+    OCR_DESKEW_BAND: alignConfig?.deskewBand != null ? String(alignConfig.deskewBand) : '',
+    OCR_DESKEW_SCALE: alignConfig?.deskewScale != null ? String(alignConfig.deskewScale) : '',
+    OCR_DESKEW_METHOD: alignConfig?.deskewMethod || '',
+    OCR_WORK_SCALE: alignConfig?.workScale != null ? String(alignConfig.workScale) : '',
+    MICR_TESS_LANG: alignConfig?.micrTessLang ? String(alignConfig.micrTessLang) : '',
+    OCR_MICR_MIN_CONFIDENCE: alignConfig?.micrMinConfidence != null ? String(alignConfig.micrMinConfidence) : '',
+    OCR_CASCADE: alignConfig?.cascade ? '1' : '0',
+    OCR_CASCADE_MIN_CONFIDENCE: alignConfig?.cascadeMinConfidence != null ? String(alignConfig.cascadeMinConfidence) : '',
+    OCR_LAYOUTS: alignConfig?.layouts ? '1' : '0',
+    OCR_MULTI_CHECK: alignConfig?.multiCheck ? '1' : '0'
+});
+
+// An idle worker must not keep the process alive; it holds the event loop only while requests are pending.
+const setOcrWorkerRef = (worker, active) => {
+    const method = active ? 'ref' : 'unref';
+    worker.child[method]();
+    [worker.child.stdin, worker.child.stdout].forEach((stream) => stream?.[method]?.());
+};
+
+const startOcrWorker = async () => {
+    const command = await resolvePythonCommand();
+    const child = spawn(command, [getOcrScriptPath(), '--serve'], {
+        env: { ...process.env, DISABLE_MODEL_SOURCE_CHECK: 'True' },
+        stdio: ['pipe', 'pipe', 'ignore']
+    });
+    const worker = {
+        child,
+        pending: new Map(),
+        nextId: 1,
+        lastUsed: Date.now(),
+        closed: false
+    };
+    setOcrWorkerRef(worker, false);
+
+    const failAll = (error) => {
+        worker.closed = true;
+        worker.pending.forEach(({ reject, timer }) => {
+            clearTimeout(timer);
+            reject(error);
+        });
+        worker.pending.clear();
+        if (ocrWorker === worker) {
+            ocrWorker = null;
         }
+    };
+
+    worker.ready = new Promise((resolve, reject) => {
+        const readyTimer = setTimeout(() => {
+            reject(new Error('OCR worker did not become ready.'));
+            child.kill();
+        }, OCR_WORKER_TIMEOUT_MS);
+        const lines = createInterface({ input: child.stdout });
+        lines.on('line', (line) => {
+            let message;
+            try {
+                message = JSON.parse(line);
+            } catch {
+                return;
+            }
+            if (message.type === 'ready') {
+                clearTimeout(readyTimer);
+                resolve(worker);
+                return;
+            }
+            const entry = worker.pending.get(message.id);
+            if (!entry) return;
+            if (message.type === 'result' && entry.onResult) {
+                entry.onResult(message);
+                entry.touch();
+                return;
+            }
+            worker.pending.delete(message.id);
+            clearTimeout(entry.timer);
+            if (!worker.pending.size) {
+                setOcrWorkerRef(worker, false);
+            }
+            if (message.type === 'error') {
+                // The worker answered and is still running; only the request itself failed.
+                const error = new Error(message.error || 'OCR worker error');
+                error.code = 'OCR_REQUEST_FAILED';
+                entry.reject(error);
+            } else {
+                entry.resolve(message);
+            }
+        });
+        child.on('error', (error) => {
+            clearTimeout(readyTimer);
+            reject(error);
+            failAll(error);
+        });
+        child.on('exit', (code) => {
+            clearTimeout(readyTimer);
+            const error = new Error(`OCR worker exited with code ${code}`);
+            reject(error);
+            failAll(error);
+        });
+    });
+    return worker.ready;
+};
+
+const sendOcrWorkerRequest = (worker, message, timeoutMs = OCR_WORKER_TIMEOUT_MS, onResult = null) => new Promise((resolve, reject) => {
+    if (worker.closed) {
+        reject(new Error('OCR worker is not running.'));
+        return;
     }
-    const commandToRun = process.platform === 'win32' ? (await ensureCommand('python').then(() => 'python').catch(() => 'py')) : pythonCommand;
-    const scriptPath = join(process.cwd(), 'server', 'ocr', 'handwriting_ocr.py');
-    const stdout = await runCommand(commandToRun, [scriptPath, imagePath], {
+    const id = worker.nextId;
+    worker.nextId += 1;
+    const onTimeout = () => {
+        worker.pending.delete(id);
+        reject(new Error('OCR worker request timed out.'));
+        worker.child.kill();
+    };
+    const entry = { resolve, reject, onResult, timer: setTimeout(onTimeout, timeoutMs) };
+    // Batch requests stream one result per image; each one restarts the timeout.
+    entry.touch = () => {
+        clearTimeout(entry.timer);
+        entry.timer = setTimeout(onTimeout, timeoutMs);
+        worker.lastUsed = Date.now();
+    };
+    worker.pending.set(id, entry);
+    setOcrWorkerRef(worker, true);
+    worker.lastUsed = Date.now();
+    worker.child.stdin.write(`${JSON.stringify({ ...message, id })}\n`);
+});
+
+const getOcrWorker = async () => {
+    if (ocrWorker && !ocrWorker.closed && Date.now() - ocrWorker.lastUsed > OCR_WORKER_IDLE_CHECK_MS) {
+        const worker = ocrWorker;
+        try {
+            await sendOcrWorkerRequest(worker, { type: 'health' }, OCR_WORKER_HEALTH_TIMEOUT_MS);
+        } catch {
+            worker.child.kill();
+            if (ocrWorker === worker) {
+                ocrWorker = null;
+            }
+        }
+    }
+    if (!ocrWorker || ocrWorker.closed) {
+        ocrWorker = startOcrWorker();
+        ocrWorker.catch(() => {
+            ocrWorker = null;
+        });
+        ocrWorker = await ocrWorker;
+    }
+    return ocrWorker;
+};
+
+export const stopOcrWorker = () => {
+    if (!ocrWorker || ocrWorker.closed) return;
+    const worker = ocrWorker;
+    ocrWorker = null;
+    sendOcrWorkerRequest(worker, { type: 'shutdown' }, OCR_WORKER_HEALTH_TIMEOUT_MS)
+        .catch(() => {})
+        .finally(() => worker.child.stdin.end());
+};
+
+// With no count (PDF input) the page count is whatever the OCR process reported. Each payload keeps the
+// source the OCR process named it by (e.g. checks.pdf#page=2).
+const collectBatchResults = (messages, count = null) => {
+    const total = count ?? messages.reduce((max, message) => Math.max(max, message.index + 1), 0);
+    const results = new Array(total).fill(null);
+    messages.forEach((message) => {
+        if (message.index >= 0 && message.index < total) {
+            results[message.index] = message.payload && message.source
+                ? { ...message.payload, source: message.source }
+                : message.payload;
+        }
+    });
+    return results;
+};
+
+const runOcrBatchScript = async (imagePaths, ocrEnv, count = imagePaths.length) => {
+    const commandToRun = await resolvePythonCommand();
+    const stdout = await runCommand(commandToRun, [getOcrScriptPath(), '--batch', ...imagePaths], {
         env: {
             ...process.env,
-            DISABLE_MODEL_SOURCE_CHECK: 'True'
-            ,
-            OCR_REGIONS: JSON.stringify(regions || {}),
-            OCR_ENGINES: JSON.stringify(engines || []),
-            OCR_REGION_ORIGIN: regionOrigin || 'top-left',
-            OCR_REGION_ANCHOR: regionAnchor || 'none',
-            OCR_DEBUG_IMAGES: includePreviews ? '1' : '0',
-            OCR_TROCR_MODEL: ocrModel || '',
-            OCR_CROP_MAX_SIZE: cropMaxSize ? String(cropMaxSize) : '',
-            OCR_PREVIEW_ONLY: previewOnly ? '1' : '0',
-            OCR_ALIGN: alignConfig?.enabled ? '1' : '0',
-            OCR_BOUNDS_PADDING: alignConfig?.boundsPadding != null ? String(alignConfig.boundsPadding) : '',
-            OCR_DESKEW_MAX_ANGLE: alignConfig?.deskewMaxAngle != null ? String(alignConfig.deskewMaxAngle) : '',
-            OCR_DESKEW_STEP: alignConfig?.deskewStep != null ? String(alignConfig.deskewStep) : '',
-            OCR_DESKEW_BAND: alignConfig?.deskewBand != null ? String(alignConfig.deskewBand) : '',
-            OCR_DESKEW_SCALE: alignConfig?.deskewScale != null ? String(alignConfig.deskewScale) : '',
-            MICR_TESS_LANG: alignConfig?.micrTessLang ? String(alignConfig.micrTessLang) : ''
+            DISABLE_MODEL_SOURCE_CHECK: 'True',
+            ...ocrEnv
+        }
+    });
+    const messages = [];
+    stdout.split(/\r?\n/).forEach((line) => {
+        if (!line.trim()) return;
+        try {
+            const message = JSON.parse(line);
+            if (message.type === 'result') {
+                messages.push(message);
+            }
+        } catch {
+            // Ignore stray non-JSON output.
         }
     });
-    let parsed;
+    return collectBatchResults(messages, count);
+};
+
+// Each preview file is removed once read, whichever directory the OCR process wrote it to.
+const readPreviewBase64 = async (path) => {
+    if (!path) return null;
     try {
-        parsed = extractJsonPayload(stdout);
-    } catch (error) {
-        throw new Error(`OCR output is not valid JSON: ${error?.message || 'parse error'}`);
+        return (await readFile(path)).toString('base64');
+    } catch {
+        return null;
+    } finally {
+        await rm(path, { force: true }).catch(() => {});
+    }
+};
+
+// Previews come back as files so the OCR stream stays small; callers still get base64 fields.
+const inlineOcrPreviews = async (result) => {
+    if (!result) return result;
+    if (Array.isArray(result.checks)) {
+        await Promise.all(result.checks.map(inlineOcrPreviews));
+    }
+    if (result.alignedPreviewPath) {
+        result.alignedPreviewBase64 = await readPreviewBase64(result.alignedPreviewPath);
+        delete result.alignedPreviewPath;
+    }
+    await Promise.all(Object.values(result.regions || {}).map(async (region) => {
+        if (!region?.previewPath) return;
+        region.previewBase64 = await readPreviewBase64(region.previewPath);
+        delete region.previewPath;
+    }));
+    return result;
+};
+
+const runOcrInputs = async (inputs, ocrOptions, count) => {
+    const previewDir = ocrOptions.includePreviews ? await mkdtemp(join(tmpdir(), 'ocr-previews-')) : null;
+    try {
+        return await runOcrImageBatch(inputs, ocrOptions, previewDir, count);
+    } finally {
+        if (previewDir) {
+            await rm(previewDir, { recursive: true, force: true });
+        }
+    }
+};
+
+const ocrImageBatch = async (imagePaths, ocrOptions = {}) => {
+    if (!imagePaths.length) return [];
+    return runOcrInputs(imagePaths, ocrOptions, imagePaths.length);
+};
+
+// The OCR process renders each page and streams its result as soon as the page is recognized.
+const ocrPdfPages = (pdfPath, ocrOptions = {}) => runOcrInputs([pdfPath], ocrOptions, null);
+
+const runOcrImageBatch = async (imagePaths, ocrOptions, previewDir, count) => {
+    const ocrEnv = buildOcrEnv(ocrOptions);
+    if (previewDir) {
+        ocrEnv.OCR_PREVIEW_MODE = 'file';
+        ocrEnv.OCR_PREVIEW_DIR = previewDir;
+    }
+    let results = null;
+    if (OCR_WORKER_ENABLED) {
+        try {
+            const worker = await getOcrWorker();
+            const messages = [];
+            await sendOcrWorkerRequest(
+                worker,
+                { type: 'batch', images: imagePaths, env: ocrEnv },
+                OCR_WORKER_TIMEOUT_MS,
+                (message) => messages.push(message)
+            );
+            results = collectBatchResults(messages, count);
+        } catch (error) {
+            // A rejected request would fail the same way in a one-shot process; only a lost worker falls back.
+            if (error?.code === 'OCR_REQUEST_FAILED') {
+                throw error;
+            }
+            console.warn('OCR worker unavailable, falling back to one-shot OCR:', error?.message || error);
+        }
     }
-    if (!parsed || !Array.isArray(parsed.lines)) {
-        throw new Error('OCR output missing lines');
+    if (!results) {
+        results = await runOcrBatchScript(imagePaths, ocrEnv, count);
     }
-    return parsed;
+    results.forEach((parsed) => {
+        if (!parsed || !Array.isArray(parsed.lines)) {
+            throw new Error('OCR output missing lines');
+        }
+    });
+    return Promise.all(results.map(inlineOcrPreviews));
 };
 
+// A page segmented into several checks carries one payload per check; each becomes its own entry.
+const expandOcrChecks = (ocrResults, sources) => ocrResults.flatMap((ocrResult, index) => (
+    Array.isArray(ocrResult?.checks) && ocrResult.checks.length
+        ? ocrResult.checks.map((check, checkIndex) => ({
+            ocrResult: check,
+            source: `${sources[index]}#check=${checkIndex + 1}`,
+            pageBounds: check.bounds || null
+        }))
+        : [{ ocrResult, source: sources[index], pageBounds: null }]
+));
+
 const clamp = (value, min = 0, max = 1) => Math.min(Math.max(value, min), max);
 
 const normalizeRegion = (region = {}) => ({
@@ -538,6 +783,10 @@ const parseCheckFromOcr = (ocrResult, regions = DEFAULT_OCR_REGIONS) => {
     if (amount == null && legalAmountValue != null) {
         amount = legalAmountValue;
     }
+    if (ocrResult?.amountCheck?.match) {
+        amount = ocrResult.amountCheck.value;
+        legalAmountValue = ocrResult.amountCheck.value;
+    }
     let amountMatch = null;
     if (amount != null && legalAmountValue != null) {
         amountMatch = Math.abs(amount - legalAmountValue) < 0.01;
@@ -612,24 +861,43 @@ export const extractChecksFromPdf = async (checksPdfPath, options = {}) => {
     const cropMaxSize = options.ocrCropMaxSize || '';
     const previewOnly = options.ocrPreviewOnly === true;
     const alignConfig = options.ocrAlign || {};
+    const ocrOptions = {
+        regions,
+        engines: ocrEngines,
+        regionOrigin,
+        includePreviews: includeOcrLines,
+        regionAnchor,
+        ocrModel,
+        cropMaxSize,
+        previewOnly,
+        alignConfig
+    };
     const tempDir = await getTempDir();
     try {
-        const images = await convertPdfToImages(checksPdfPath, tempDir);
+        let sources = null;
+        let ocrResults = null;
+        if (ocrPdfDirect) {
+            try {
+                ocrResults = await ocrPdfPages(checksPdfPath, ocrOptions);
+                sources = ocrResults.map((ocrResult, index) => ocrResult?.source || `${basename(checksPdfPath)}#page=${index + 1}`);
+            } catch (error) {
+                // Only a missing renderer disables direct PDF input for good; anything else is this request's failure.
+                if (/pypdfium2/.test(error?.message || '')) {
+                    ocrPdfDirect = false;
+                    console.warn('In-process PDF rendering unavailable, using pdftoppm:', error.message);
+                } else {
+                    console.warn('Direct PDF OCR failed, retrying with pdftoppm:', error?.message || error);
+                }
+            }
+        }
+        if (!ocrResults) {
+            const images = await convertPdfToImages(checksPdfPath, tempDir);
+            ocrResults = await ocrImageBatch(images, ocrOptions);
+            sources = images.map((imagePath) => basename(imagePath));
+        }
         const checks = [];
 
-        for (const imagePath of images) {
-            const ocrResult = await ocrImageLines(
-                imagePath,
-                regions,
-                ocrEngines,
-                regionOrigin,
-                includeOcrLines,
-                regionAnchor,
-                ocrModel,
-                cropMaxSize,
-                previewOnly,
-                alignConfig
-            );
+        for (const { ocrResult, source, pageBounds } of expandOcrChecks(ocrResults, sources)) {
             const result = parseCheckFromOcr(ocrResult, regions);
             const checkNumber = result.checkNumber || '';
             const amount = result.amount ?? null;
@@ -649,7 +917,8 @@ export const extractChecksFromPdf = async (checksPdfPath, options = {}) => {
                     }))
                 : undefined;
             checks.push({
-                source: basename(imagePath),
+                source,
+                pageBounds,
                 checkNumber,
                 amount,
                 missing: {
@@ -664,7 +933,8 @@ export const extractChecksFromPdf = async (checksPdfPath, options = {}) => {
                 micrDigits,
                 micrParsed,
                 ocrRegions: includeOcrLines ? ocrResult.regions || null : null,
-                alignedPreviewBase64: includeOcrLines ? ocrResult.alignedPreviewBase64 || null : null
+                alignedPreviewBase64: includeOcrLines ? ocrResult.alignedPreviewBase64 || null : null,
+                alignedPreviewFormat: includeOcrLines ? ocrResult.previewFormat || 'png' : null
             });
         }
 
@@ -695,19 +965,19 @@ export const extractChecksFromImages = async (imagePaths, options = {}) => {
     });
 
     const checks = [];
-    for (const image of normalized) {
-        const ocrResult = await ocrImageLines(
-            image.path,
-            regions,
-            ocrEngines,
-            regionOrigin,
-            includeOcrLines,
-            regionAnchor,
-            ocrModel,
-            cropMaxSize,
-            previewOnly,
-            alignConfig
-        );
+    const ocrResults = await ocrImageBatch(normalized.map((image) => image.path), {
+        regions,
+        engines: ocrEngines,
+        regionOrigin,
+        includePreviews: includeOcrLines,
+        regionAnchor,
+        ocrModel,
+        cropMaxSize,
+        previewOnly,
+        alignConfig
+    });
+    const sources = normalized.map((image) => image.source);
+    for (const { ocrResult, source, pageBounds } of expandOcrChecks(ocrResults, sources)) {
         const result = parseCheckFromOcr(ocrResult, regions);
         const checkNumber = result.checkNumber || '';
         const amount = result.amount ?? null;
@@ -727,7 +997,8 @@ export const extractChecksFromImages = async (imagePaths, options = {}) => {
                 }))
             : undefined;
         checks.push({
-            source: image.source,
+            source,
+            pageBounds,
             checkNumber,
             amount,
             missing: {
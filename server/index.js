@@ -4,7 +4,7 @@ import dotenv from 'dotenv';
 import multer from 'multer';
 import { addMonths, format } from 'date-fns';
 import { PDFDocument, StandardFonts, rgb } from 'pdf-lib';
-import { access, copyFile, mkdir, readFile, readdir, rm, stat, writeFile } from 'fs/promises';
+import { access, copyFile, mkdir, readFile, readdir, rename, rm, stat, writeFile } from 'fs/promises';
 import { join, dirname, resolve, basename, extname } from 'path';
 import { homedir, tmpdir } from 'os';
 import { fileURLToPath } from 'url';
@@ -23,7 +23,7 @@ import { createOAuthClient, getAuthUrl, getTokensFromCode, setStoredCredentials,
 import { fetchGoogleCalendarEvents, fetchCalendarList } from './googleCalendar.js';
 import { google } from 'googleapis';
 import { syncGoogleEvents } from './eventEngine.js';
-import { buildDepositSlipPdf, convertPdfToImages, extractChecksFromImages } from './depositSlip.js';
+import { buildDepositSlipPdf, extractChecksFromImages, extractChecksFromPdf } from './depositSlip.js';
 
 dotenv.config({ path: './server/.env' });
 
@@ -5055,8 +5055,13 @@ app.post('/api/deposit-slip/pdf', pdfUpload.single('checksPdf'), async (req, res
 
         conversionDir = join(tmpdir(), `deposit-slip-pdf-${Date.now()}`);
         await mkdir(conversionDir, { recursive: true });
-        const images = await convertPdfToImages(uploadedPath, conversionDir);
-        const ocrChecks = await extractChecksFromImages(images, {
+        // The OCR process recognizes PDFs by extension and names pages after the file; multer's upload has neither.
+        const uploadName = basename(req.file.originalname || '').replace(/\.pdf$/i, '') || 'checks';
+        const pdfPath = join(conversionDir, `${uploadName}.pdf`);
+        await rename(uploadedPath, pdfPath);
+        uploadedPath = pdfPath;
+        // Pages are rendered inside the OCR process; each check's aligned preview feeds the grid pages.
+        const ocrChecks = await extractChecksFromPdf(pdfPath, {
             ocrRegions: config.ocrRegions,
             includeOcrLines: true,
             ocrEngines: config.ocrEngines,
@@ -5104,11 +5109,7 @@ app.post('/api/deposit-slip/pdf', pdfUpload.single('checksPdf'), async (req, res
         const [depositPage] = await finalDoc.copyPages(depositDoc, [0]);
         finalDoc.addPage(depositPage);
 
-        const checkAssets = ocrChecks.map((check, index) => ({
-            ...check,
-            imagePath: images[index]
-        }));
-        await addCheckGridPages(finalDoc, checkAssets, {
+        await addCheckGridPages(finalDoc, ocrChecks, {
             pageWidth: depositPage.getWidth(),
             pageHeight: depositPage.getHeight()
         });
@@ -5145,20 +5146,22 @@ const addCheckGridPages = async (pdfDoc, checks, options = {}) => {
     if (!checks || checks.length === 0) return;
     let page = null;
     let drawn = 0;
+    let font = null;
     for (let index = 0; index < checks.length; index += 1) {
         const entry = checks[index];
         const base64 = entry?.alignedPreviewBase64;
-        let imageBytes = null;
-        if (base64) {
-            imageBytes = Buffer.from(base64, 'base64');
-        } else if (entry?.imagePath) {
-            try {
-                imageBytes = await readFile(entry.imagePath);
-            } catch {
-                imageBytes = null;
-            }
+        const format = entry?.alignedPreviewFormat || 'png';
+        let image = null;
+        let missingReason = null;
+        if (!base64) {
+            missingReason = entry?.ocrError || 'no preview image';
+        } else if (format === 'png') {
+            image = await pdfDoc.embedPng(Buffer.from(base64, 'base64'));
+        } else if (format === 'jpeg') {
+            image = await pdfDoc.embedJpg(Buffer.from(base64, 'base64'));
+        } else {
+            missingReason = `unsupported preview format: ${format}`;
         }
-        if (!imageBytes) continue;
         if (drawn % perPage === 0) {
             page = pdfDoc.addPage([pageWidth, pageHeight]);
         }
@@ -5169,7 +5172,33 @@ const addCheckGridPages = async (pdfDoc, checks, options = {}) => {
         const cellHeight = (pageHeight - margin * 2 - rowGap * (rows - 1)) / rows;
         const targetX = margin + column * (cellWidth + colGap);
         const targetYTop = pageHeight - margin - row * (cellHeight + rowGap);
-        const image = await pdfDoc.embedPng(imageBytes);
+        // A check without an image still gets its cell so it is not silently missing from the printout.
+        if (!image) {
+            font = font || await pdfDoc.embedFont(StandardFonts.Helvetica);
+            page.drawRectangle({
+                x: targetX,
+                y: targetYTop - cellHeight,
+                width: cellWidth,
+                height: cellHeight,
+                borderColor: rgb(0.6, 0.6, 0.6),
+                borderWidth: 1
+            });
+            // Helvetica only encodes WinAnsi, so file names and error text are reduced to printable ASCII.
+            const printable = (text) => String(text).replace(/[^\x20-\x7e]/g, '?').slice(0, 200);
+            const label = printable(`Check ${index + 1}${entry?.source ? ` (${entry.source})` : ''}`);
+            page.drawText(label, { x: targetX + 8, y: targetYTop - 20, size: 10, font, maxWidth: cellWidth - 16 });
+            page.drawText(printable(`No image: ${missingReason}`), {
+                x: targetX + 8,
+                y: targetYTop - 36,
+                size: 9,
+                font,
+                color: rgb(0.6, 0, 0),
+                maxWidth: cellWidth - 16,
+                lineHeight: 11
+            });
+            drawn += 1;
+            continue;
+        }
         const scaled = image.scale(Math.min(cellWidth / image.width, cellHeight / image.height, 1));
         const offsetX = targetX + (cellWidth - scaled.width) / 2;
         const offsetY = targetYTop - scaled.height;
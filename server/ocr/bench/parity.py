@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handwriting_ocr  # noqa: E402
+from synth import generate_set  # noqa: E402
+
+
+def timed_recognize(engine, crops, batch_size):
+    started = time.perf_counter()
+    results = engine.recognize(crops, batch_size=batch_size)
+    return [text for text, _ in results], time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare trocr-onnx against the PyTorch TrOCR path on synthetic crops.")
+    parser.add_argument("--count", type=int, default=10, help="number of synthetic checks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="where synthetic checks are written (reused when the spec matches)")
+    parser.add_argument("--backend", default=None, help="onnx, int8 or auto (default: OCR_TROCR_BACKEND)")
+    parser.add_argument("--max-new-tokens", type=int, default=None, help="default: OCR_TROCR_MAX_NEW_TOKENS or 24")
+    parser.add_argument("--repeat", type=int, default=2, help="timed passes per engine after one warmup pass")
+    parser.add_argument("--max-mismatches", type=int, default=0, help="exit non-zero above this many differing strings")
+    args = parser.parse_args()
+
+    directory = args.data_dir or os.path.join(tempfile.gettempdir(), "handwriting_ocr_bench", f"parity-n{args.count}-s{args.seed}")
+    manifest = generate_set(directory, args.count, args.seed)
+
+    env = dict(os.environ)
+    env.update({"OCR_CACHE": "0", "OCR_ALIGN": env.get("OCR_ALIGN", "1"), "OCR_REGION_ANCHOR": env.get("OCR_REGION_ANCHOR", "micr")})
+    config = handwriting_ocr.load_config(env)
+    max_new_tokens = args.max_new_tokens or config["trocr_max_new_tokens"] or 24
+    # Both paths decode under the same token cap so only the backend differs.
+    reference = handwriting_ocr.TrocrEngine(config["model_name"], max_new_tokens=max_new_tokens, model_dir=config["model_dir"])
+    candidate = handwriting_ocr.TrocrFastEngine(
+        config["model_name"],
+        backend=args.backend or config["trocr_backend"],
+        max_new_tokens=max_new_tokens,
+        export_dir=os.path.join(config["cache_dir"], "onnx"),
+        model_dir=config["model_dir"],
+    )
+
+    jobs = []
+    for check in manifest["checks"]:
+        page = handwriting_ocr.prepare_page(os.path.join(directory, check["file"]), config)
+        jobs.extend((check["file"], key, crop) for key, crop in page["crops"].items() if key != "micr")
+    crops = [crop for _, _, crop in jobs]
+
+    timings = {}
+    outputs = {}
+    for label, engine in (("pytorch", reference), (candidate.name, candidate)):
+        outputs[label], _ = timed_recognize(engine, crops, config["trocr_batch_size"])
+        timings[label] = min(timed_recognize(engine, crops, config["trocr_batch_size"])[1] for _ in range(max(1, args.repeat)))
+
+    mismatches = [
+        {"file": name, "region": key, "pytorch": expected, candidate.name: actual}
+        for (name, key, _), expected, actual in zip(jobs, outputs["pytorch"], outputs[candidate.name])
+        if expected != actual
+    ]
+    report = {
+        "model": config["model_name"],
+        "backend": candidate.backend,
+        "maxNewTokens": max_new_tokens,
+        "crops": len(jobs),
+        "mismatches": mismatches,
+        "seconds": {label: round(value, 3) for label, value in timings.items()},
+        "speedup": round(timings["pytorch"] / timings[candidate.name], 3) if timings[candidate.name] else None,
+    }
+    print(json.dumps(report, indent=2))
+    if len(mismatches) > args.max_mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handwriting_ocr  # noqa: E402
+from synth import generate_set, render_check  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Checks re-rendered per config for the field placement check.
+FIELD_CHECK_SAMPLE = 5
+
+FIELD_TRUTH = {
+    "numericAmount": lambda truth: digits(truth["numericAmount"]),
+    "legalAmount": lambda truth: words(truth["legalAmount"]),
+    "checkNumber": lambda truth: digits(truth["checkNumber"]),
+    "micr": lambda truth: digits(truth["routing"] + truth["account"] + truth["checkNumber"]),
+}
+
+FIELD_NORMALIZE = {
+    "numericAmount": lambda text: digits(text),
+    "legalAmount": lambda text: words(text),
+    "checkNumber": lambda text: digits(text),
+    "micr": lambda text: digits(text),
+}
+
+
+def digits(text):
+    return re.sub(r"\D", "", text or "")
+
+
+def words(text):
+    return " ".join(re.findall(r"[a-z0-9/]+", (text or "").lower().replace("-", " ")))
+
+
+def edit_distance(left, right):
+    previous = list(range(len(right) + 1))
+    for i, left_char in enumerate(left, 1):
+        current = [i]
+        for j, right_char in enumerate(right, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (left_char != right_char)))
+        previous = current
+    return previous[-1]
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p90": round(float(np.percentile(values, 90)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+        "n": int(values.size),
+    }
+
+
+def score_field(scores, key, expected, text):
+    entry = scores.setdefault(key, {"exact": 0, "editDistance": 0, "chars": 0, "n": 0})
+    entry["n"] += 1
+    entry["exact"] += int(text == expected)
+    entry["editDistance"] += edit_distance(text, expected)
+    entry["chars"] += max(1, len(expected))
+
+
+def summarize_scores(scores):
+    return {
+        key: {
+            "exact": round(entry["exact"] / entry["n"], 4),
+            "cer": round(entry["editDistance"] / entry["chars"], 4),
+            "n": entry["n"],
+        }
+        for key, entry in sorted(scores.items())
+    }
+
+
+def coverage(inner, outer):
+    # Fraction of `inner` that lies inside `outer`, per axis; the smaller of the two.
+    spans = []
+    for low, high in ((0, 2), (1, 3)):
+        size = max(1, inner[high] - inner[low])
+        spans.append(max(0, min(inner[high], outer[high]) - max(inner[low], outer[low])) / size)
+    return min(spans)
+
+
+def check_field_crops(config, truths, min_coverage=0.8):
+    # Renders clean, unskewed copies of the checks and confirms each ground-truth field lies inside the
+    # crop the pipeline cuts for it; otherwise accuracy measures crop placement, not recognition.
+    config = {**config, "work_scale": 1.0, "layout_mode": "0", "preview_only": False, "include_previews": False}
+    problems = []
+    for index, truth in enumerate(truths):
+        fields = {}
+        image = render_check(truth, random.Random(index), fields=fields)
+        page = handwriting_ocr.prepare_check(image, config, None)
+        left = top = 0
+        alignment = page["alignment"]
+        if alignment is not None:
+            left, top = alignment["bounds"][0], alignment["bounds"][1]
+            if alignment["trim"] is not None:
+                left, top = left + alignment["trim"][0], top + alignment["trim"][1]
+        for key, box in fields.items():
+            crop = page["cropBoxes"].get(key)
+            if crop is None:
+                continue
+            field = (box[0] - left, box[1] - top, box[2] - left, box[3] - top)
+            if coverage(field, crop) < min_coverage:
+                problems.append(f"{key} of check {index}: field {tuple(int(value) for value in field)} outside crop {crop}")
+    return problems
+
+
+def run_config(bench_config, checks, directory, repeat, warmup):
+    env = dict(os.environ)
+    env.update({key: str(value) for key, value in (bench_config.get("env") or {}).items()})
+    # Every run must do the full work and report its stage timings.
+    env.update({"OCR_CACHE": "0", "OCR_PROFILE": "1", "OCR_PROFILE_DUMP": ""})
+    config = handwriting_ocr.load_config(env)
+    runtime = {}
+
+    problems = check_field_crops(config, [check["truth"] for check in checks[:FIELD_CHECK_SAMPLE]])
+    if problems:
+        raise SystemExit(f"{bench_config['name']}: synthetic fields fall outside their crops:\n  " + "\n  ".join(problems))
+
+    model_load_ms = 0.0
+    started = time.perf_counter()
+    for _ in range(warmup):
+        payload = handwriting_ocr.build_payload(os.path.join(directory, checks[0]["file"]), config=config, runtime=runtime)
+        model_load_ms += (payload.get("timings") or {}).get("modelLoadMs") or 0.0
+    warmup_ms = (time.perf_counter() - started) * 1000.0
+
+    stage_samples = {}
+    scores = {}
+    engine_scores = {}
+    errors = {}
+    total_seconds = 0.0
+    for _ in range(repeat):
+        for check in checks:
+            started = time.perf_counter()
+            payload = handwriting_ocr.build_payload(os.path.join(directory, check["file"]), config=config, runtime=runtime)
+            elapsed = time.perf_counter() - started
+            total_seconds += elapsed
+
+            timings = payload.get("timings") or {}
+            stage_samples.setdefault("total", []).append(elapsed * 1000.0)
+            stage_samples.setdefault("inference", []).append(timings.get("inferenceMs") or 0.0)
+            for name, entry in (timings.get("stages") or {}).items():
+                stage_samples.setdefault(name, []).append(entry["wallMs"])
+            model_load_ms += timings.get("modelLoadMs") or 0.0
+            for message in payload.get("errors") or ([payload["error"]] if payload.get("error") else []):
+                errors[message] = errors.get(message, 0) + 1
+
+            for key, result in (payload.get("regions") or {}).items():
+                if key not in FIELD_TRUTH:
+                    continue
+                expected = FIELD_TRUTH[key](check["truth"])
+                normalize = FIELD_NORMALIZE[key]
+                score_field(scores, key, expected, normalize(result.get("text")))
+                for engine, text in (result.get("candidates") or {}).items():
+                    score_field(engine_scores.setdefault(engine, {}), key, expected, normalize(text))
+
+    measured = repeat * len(checks)
+    return {
+        "name": bench_config["name"],
+        "env": bench_config.get("env") or {},
+        "checks": measured,
+        "seconds": round(total_seconds, 3),
+        "checksPerSecond": round(measured / total_seconds, 3) if total_seconds else None,
+        "warmupMs": round(warmup_ms, 3),
+        "modelLoadMs": round(model_load_ms, 3),
+        "peakRssMb": handwriting_ocr.peak_rss_mb(),
+        "latencyMs": {name: percentiles(values) for name, values in stage_samples.items()},
+        "accuracy": summarize_scores(scores),
+        "engineAccuracy": {engine: summarize_scores(entry) for engine, entry in sorted(engine_scores.items())},
+        "errors": errors,
+    }
+
+
+def format_summary(result, previous=None):
+    parts = [f"{result['name']:<28}", f"{result['checksPerSecond'] or 0:8.2f} checks/s"]
+    total = result["latencyMs"].get("total")
+    if total:
+        parts.append(f"p50 {total['p50']:8.1f} ms  p90 {total['p90']:8.1f} ms")
+    for key, entry in result["accuracy"].items():
+        parts.append(f"{key} {entry['exact'] * 100:5.1f}%")
+    line = "  ".join(parts)
+    if previous:
+        before = previous.get("checksPerSecond") or 0
+        after = result.get("checksPerSecond") or 0
+        if before:
+            line += f"  ({(after - before) / before * 100:+.1f}% throughput)"
+        for key, entry in result["accuracy"].items():
+            old = (previous.get("accuracy") or {}).get(key)
+            if old and old["exact"] != entry["exact"]:
+                line += f"  {key} {(entry['exact'] - old['exact']) * 100:+.1f}pt"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark handwriting_ocr.py on synthetic checks.")
+    parser.add_argument("--count", type=int, default=20, help="number of synthetic checks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-skew", type=float, default=2.0, help="maximum rotation in degrees")
+    parser.add_argument("--noise", type=float, default=0.04, help="gaussian noise sigma as a fraction of full scale")
+    parser.add_argument("--blur", type=float, default=0.6, help="gaussian blur radius in pixels")
+    parser.add_argument("--data-dir", help="where synthetic checks are written (reused when the spec matches)")
+    parser.add_argument("--configs", default=os.path.join(BENCH_DIR, "configs.json"))
+    parser.add_argument("--only", action="append", help="run only the named config (repeatable)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per config; these absorb model loading")
+    parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    args = parser.parse_args()
+
+    directory = args.data_dir or os.path.join(
+        tempfile.gettempdir(),
+        "handwriting_ocr_bench",
+        f"n{args.count}-s{args.seed}-k{args.max_skew}-z{args.noise}-b{args.blur}",
+    )
+    manifest = generate_set(directory, args.count, args.seed, args.max_skew, args.noise, args.blur)
+
+    with open(args.configs, "r", encoding="utf-8") as handle:
+        bench_configs = json.load(handle)
+    if args.only:
+        bench_configs = [item for item in bench_configs if item["name"] in args.only]
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            previous = {item["name"]: item for item in json.load(handle).get("configs", [])}
+
+    results = []
+    for bench_config in bench_configs:
+        result = run_config(bench_config, manifest["checks"], directory, max(1, args.repeat), max(0, args.warmup))
+        results.append(result)
+        print(format_summary(result, previous.get(result["name"])), file=sys.stderr)
+
+    report = {
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "dataset": {"directory": directory, **manifest["spec"]},
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "configs": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
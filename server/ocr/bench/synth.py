@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import json
+import os
+import random
+import sys
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+CHECK_WIDTH = 1800
+CHECK_HEIGHT = 800
+
+# Bump when render_check moves a field; cached sets drawn with an older layout are then regenerated.
+LAYOUT_VERSION = 2
+
+ONES = [
+    "",
+    "one",
+    "two",
+    "three",
+    "four",
+    "five",
+    "six",
+    "seven",
+    "eight",
+    "nine",
+    "ten",
+    "eleven",
+    "twelve",
+    "thirteen",
+    "fourteen",
+    "fifteen",
+    "sixteen",
+    "seventeen",
+    "eighteen",
+    "nineteen",
+]
+TENS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+
+
+def words_below_thousand(value):
+    words = []
+    if value >= 100:
+        words += [ONES[value // 100], "hundred"]
+        value %= 100
+    if value >= 20:
+        words.append(TENS[value // 10] + (f"-{ONES[value % 10]}" if value % 10 else ""))
+    elif value:
+        words.append(ONES[value])
+    return words
+
+
+def legal_amount_text(cents):
+    dollars, cents = divmod(cents, 100)
+    words = []
+    if dollars >= 1000:
+        words += words_below_thousand(dollars // 1000) + ["thousand"]
+    words += words_below_thousand(dollars % 1000)
+    text = " ".join(words or ["zero"])
+    return f"{text[0].upper()}{text[1:]} and {cents:02d}/100"
+
+
+def numeric_amount_text(cents):
+    return f"{cents // 100:,}.{cents % 100:02d}"
+
+
+def load_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 or no FreeType: fixed-size bitmap font.
+        return ImageFont.load_default()
+
+
+def draw_handwriting(image, text, x, y, size, rng, slant=0.0):
+    # Each glyph is rendered on its own tile with jittered size, rotation, baseline and stroke so the
+    # line looks hand-written rather than typeset. Returns the ink bounding box.
+    ink_box = None
+    for char in text:
+        glyph_size = max(8, int(size * rng.uniform(0.9, 1.1)))
+        font = load_font(glyph_size)
+        tile = Image.new("L", (glyph_size * 2, glyph_size * 2), 0)
+        ImageDraw.Draw(tile).text(
+            (glyph_size // 2, glyph_size // 3),
+            char,
+            fill=255,
+            font=font,
+            stroke_width=rng.choice((0, 1, 1, 2)),
+            stroke_fill=255,
+        )
+        tile = tile.rotate(slant + rng.uniform(-6, 6), resample=Image.BILINEAR)
+        ink = int(rng.uniform(10, 70))
+        left, top = int(x), int(y + rng.uniform(-3, 3))
+        image.paste(Image.new("L", tile.size, ink), (left, top), tile)
+        glyph_box = solid_box(tile)
+        if glyph_box:
+            glyph_box = (left + glyph_box[0], top + glyph_box[1], left + glyph_box[2], top + glyph_box[3])
+            ink_box = glyph_box if ink_box is None else union_box(ink_box, glyph_box)
+        advance = font.getlength(char) if hasattr(font, "getlength") else glyph_size * 0.6
+        x += advance * rng.uniform(0.95, 1.15) + rng.uniform(0, 3)
+    return ink_box
+
+
+def solid_box(mask):
+    # Bounding box of the mostly-opaque pixels; anti-aliased fringes do not count as ink.
+    return mask.point(lambda value: 255 if value >= 128 else 0).getbbox()
+
+
+def union_box(left, right):
+    return (min(left[0], right[0]), min(left[1], right[1]), max(left[2], right[2]), max(left[3], right[3]))
+
+
+def draw_micr_symbol(draw, x, y, height, kind):
+    # E-13B control symbols (transit, on-us) approximated with bars.
+    bar = max(2, height // 6)
+    if kind == "transit":
+        draw.rectangle((x, y, x + bar, y + height), fill=0)
+        draw.rectangle((x + bar * 2, y + height // 4, x + bar * 4, y + height * 3 // 4), fill=0)
+    elif kind == "on-us":
+        draw.rectangle((x, y, x + bar, y + height // 2), fill=0)
+        draw.rectangle((x + bar * 2, y, x + bar * 3, y + height // 2), fill=0)
+        draw.rectangle((x + bar * 4, y, x + bar * 5, y + height // 2), fill=0)
+    return x + bar * 6
+
+
+def draw_micr_line(draw, fields, x, y, height):
+    # Returns the ink box of each field's digits (None for a symbol-only field).
+    font = load_font(height)
+    boxes = []
+    for kind, digits in fields:
+        if kind:
+            x = draw_micr_symbol(draw, x, y, height, kind)
+        boxes.append(None)
+        if digits:
+            draw.text((x, y - height // 6), digits, fill=0, font=font)
+            tile = Image.new("L", (int(font.getlength(digits)) + height, height * 2), 0)
+            ImageDraw.Draw(tile).text((0, 0), digits, fill=255, font=font)
+            ink = solid_box(tile)
+            if ink:
+                boxes[-1] = (x + ink[0], y - height // 6 + ink[1], x + ink[2], y - height // 6 + ink[3])
+            x += (font.getlength(digits) if hasattr(font, "getlength") else len(digits) * height * 0.6) + height // 2
+    return boxes
+
+
+def random_check(rng):
+    cents = rng.choice(
+        (
+            rng.randint(100, 9999),
+            rng.randint(1000, 99999),
+            rng.randint(10000, 999999),
+        )
+    )
+    return {
+        "numericAmount": numeric_amount_text(cents),
+        "legalAmount": legal_amount_text(cents),
+        "checkNumber": str(rng.randint(1001, 9999)),
+        "routing": "".join(str(rng.randint(0, 9)) for _ in range(9)),
+        "account": "".join(str(rng.randint(0, 9)) for _ in range(10)),
+    }
+
+
+def render_check(truth, rng, noise=0.0, skew=0.0, blur=0.0, fields=None):
+    # `fields`, when given, receives the unrotated ink box of each OCR field in page pixels.
+    width, height = CHECK_WIDTH, CHECK_HEIGHT
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, width - 20, height - 20), outline=90, width=3)
+
+    printed = load_font(28)
+    draw.text((60, 60), "JANE Q. PARISHIONER", fill=20, font=printed)
+    draw.text((60, 100), "123 MAIN STREET  ANYTOWN, ST 00000", fill=20, font=printed)
+    draw.text((int(width * 0.82), 60), truth["checkNumber"], fill=20, font=printed)
+    draw.text((60, int(height * 0.36)), "PAY TO THE ORDER OF", fill=20, font=printed)
+
+    # Placed so every field falls inside the crop prepare_check cuts for it, with DEFAULT_REGIONS and with
+    # the MICR-anchored bands; run.py verifies this before timing anything. The amount box's top and bottom
+    # edges stay outside the numeric band so the crop centres on the digits rather than on an edge.
+    legal_baseline = int(height * 0.575)
+    draw.line((int(width * 0.09), legal_baseline, int(width * 0.64), legal_baseline), fill=40, width=2)
+    legal_box = draw_handwriting(image, truth["legalAmount"], width * 0.11, height * 0.5275, 22, rng, slant=rng.uniform(-3, 3))
+    draw.text((int(width * 0.675), legal_baseline - 30), "DOLLARS", fill=20, font=printed)
+
+    box = (int(width * 0.76), int(height * 0.48), int(width * 0.95), int(height * 0.71))
+    draw.rectangle(box, outline=40, width=3)
+    amount_top = int(height * 0.5475)
+    draw.text((box[0] + 8, amount_top + 4), "$", fill=20, font=printed)
+    numeric_box = draw_handwriting(image, truth["numericAmount"], box[0] + 40, amount_top, 24, rng, slant=rng.uniform(-3, 3))
+
+    draw.text((60, int(height * 0.8) - 30), "MEMO", fill=20, font=printed)
+    draw.line((int(width * 0.09), int(height * 0.8), int(width * 0.45), int(height * 0.8)), fill=40, width=2)
+    draw.line((int(width * 0.55), int(height * 0.8), int(width * 0.92), int(height * 0.8)), fill=40, width=2)
+    # Starts right of centre so the on-us check number lands inside the default checkNumber region.
+    micr_boxes = draw_micr_line(
+        draw,
+        [("transit", truth["routing"]), ("transit", ""), (None, truth["account"]), ("on-us", truth["checkNumber"])],
+        int(width * 0.4),
+        int(height * 0.857),
+        36,
+    )
+
+    if fields is not None:
+        fields.update({"numericAmount": numeric_box, "legalAmount": legal_box, "checkNumber": micr_boxes[-1]})
+
+    if skew:
+        image = image.rotate(skew, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        pixels = np.asarray(image, dtype=np.float32)
+        pixels += np.random.default_rng(rng.randint(0, 2**31)).normal(0.0, noise * 255.0, pixels.shape)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return image.convert("RGB")
+
+
+def generate_set(directory, count, seed=0, max_skew=2.0, noise=0.04, blur=0.6):
+    # Deterministic for a given (count, seed, max_skew, noise, blur); an existing manifest is reused.
+    manifest_path = os.path.join(directory, "truth.json")
+    spec = {"count": count, "seed": seed, "maxSkew": max_skew, "noise": noise, "blur": blur, "layout": LAYOUT_VERSION}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+        if manifest.get("spec") == spec and all(
+            os.path.exists(os.path.join(directory, item["file"])) for item in manifest["checks"]
+        ):
+            return manifest
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    checks = []
+    for index in range(count):
+        truth = random_check(rng)
+        skew = round(rng.uniform(-max_skew, max_skew), 2) if max_skew else 0.0
+        image = render_check(truth, rng, noise=noise, skew=skew, blur=blur)
+        name = f"check-{index:03d}.png"
+        image.save(os.path.join(directory, name))
+        checks.append({"file": name, "skew": skew, "truth": truth})
+
+    manifest = {"spec": spec, "checks": checks}
+    with open(manifest_path, "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "bench-checks"
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    result = generate_set(target, total, seed=int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"{len(result['checks'])} checks in {target}")
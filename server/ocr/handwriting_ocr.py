@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
 import base64
+import hashlib
+import importlib.util
 import io
 import json
+import math
 import os
+import re
+import shutil
 import sys
+import tempfile
+import uuid
 import warnings
 import subprocess
-import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
 
-os.environ["DISABLE_MODEL_SOURCE_CHECK"] = "True"
-os.environ.setdefault("PADDLE_LOG_LEVEL", "ERROR")
-os.environ.setdefault("TRANSFORMERS_VERBOSITY", "error")
-os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+from PIL import Image
+
+__version__ = "1.1.0"
 
 DEFAULT_REGIONS = {
     "numericAmount": {"xMin": 0.73, "xMax": 0.96, "yMin": 0.56, "yMax": 0.69},
@@ -23,8 +34,25 @@ DEFAULT_REGIONS = {
 }
 
 
-def load_regions():
-    raw = os.environ.get("OCR_REGIONS")
+# TrOCR decode settings per region; any of these keys may also be set on a region in OCR_REGIONS
+# ("charset": null turns the vocabulary mask off).
+DEFAULT_GENERATION_PROFILES = {
+    "numericAmount": {"maxNewTokens": 12, "charset": "amount"},
+    "checkNumber": {"maxNewTokens": 8, "charset": "digits"},
+    "legalAmount": {"maxNewTokens": 32},
+}
+
+GENERATION_PROFILE_KEYS = ("maxNewTokens", "numBeams", "charset")
+
+CHARSETS = {
+    "digits": "0123456789 ",
+    "amount": "0123456789$.,/- ",
+}
+
+
+def load_regions(env=None):
+    env = os.environ if env is None else env
+    raw = env.get("OCR_REGIONS")
     if not raw:
         return DEFAULT_REGIONS
     try:
@@ -33,11 +61,17 @@ def load_regions():
         return DEFAULT_REGIONS
     merged = DEFAULT_REGIONS.copy()
     merged.update(regions)
+    for name, region in merged.items():
+        # A charset may be given as a JSON list of characters or charset names; profiles are cache keys.
+        if isinstance(region, dict) and isinstance(region.get("charset"), list):
+            charset = "".join(CHARSETS.get(str(item), str(item)) for item in region["charset"])
+            merged[name] = {**region, "charset": "".join(dict.fromkeys(charset))}
     return merged
 
 
-def load_engines():
-    raw = os.environ.get("OCR_ENGINES")
+def load_engines(env=None):
+    env = os.environ if env is None else env
+    raw = env.get("OCR_ENGINES")
     if not raw:
         return ["trocr"]
     try:
@@ -51,20 +85,83 @@ def clamp(value, min_value=0.0, max_value=1.0):
     return max(min_value, min(max_value, value))
 
 
-def crop_region(image, region):
-    width, height = image.size
+def region_box(region, width, height, origin=None):
     x_min = int(clamp(region.get("xMin", 0)) * width)
     x_max = int(clamp(region.get("xMax", 1)) * width)
     y_min = clamp(region.get("yMin", 0))
     y_max = clamp(region.get("yMax", 1))
-    origin = os.environ.get("OCR_REGION_ORIGIN", "top-left").lower()
+    if origin is None:
+        origin = os.environ.get("OCR_REGION_ORIGIN", "top-left").lower()
     if origin == "bottom-left":
         y_min, y_max = 1.0 - y_max, 1.0 - y_min
     y_min = int(y_min * height)
     y_max = int(y_max * height)
     if x_max <= x_min or y_max <= y_min:
-        return image
-    return image.crop((x_min, y_min, x_max, y_max))
+        return (0, 0, width, height)
+    return (x_min, y_min, x_max, y_max)
+
+
+def gray_percentile(counts, size, q):
+    # Same result as np.percentile(gray, q) (linear method), read from a uint8 histogram instead of a sort.
+    cumulative = np.cumsum(counts)
+    rank = (size - 1) * (q / 100.0)
+    lower = int(np.floor(rank))
+    gamma = rank - lower
+    low = float(np.searchsorted(cumulative, lower, side="right"))
+    high = float(np.searchsorted(cumulative, min(lower + 1, size - 1), side="right"))
+    diff = high - low
+    if gamma >= 0.5:
+        return high - diff * (1 - gamma)
+    return low + diff * gamma
+
+
+class PageAnalysis:
+    # Grayscale page, or a zero-copy window onto one, with ink statistics memoized per window.
+
+    def __init__(self, gray, left=0, top=0):
+        self.gray = gray
+        self.left = left
+        self.top = top
+        self._cache = {}
+
+    @property
+    def height(self):
+        return self.gray.shape[0]
+
+    @property
+    def width(self):
+        return self.gray.shape[1]
+
+    @property
+    def size(self):
+        return self.gray.size
+
+    @property
+    def box(self):
+        return (self.left, self.top, self.left + self.width, self.top + self.height)
+
+    def crop(self, x_min, y_min, x_max, y_max):
+        return PageAnalysis(self.gray[y_min:y_max, x_min:x_max], self.left + x_min, self.top + y_min)
+
+    def _memo(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def histogram(self):
+        return self._memo("histogram", lambda: np.bincount(self.gray.ravel(), minlength=256))
+
+    def percentile(self, q):
+        return self._memo(("percentile", q), lambda: gray_percentile(self.histogram(), self.size, q))
+
+    def ink(self, q):
+        return self._memo(("ink", q), lambda: self.gray < self.percentile(q))
+
+    def row_density(self, q):
+        return self._memo(("rows", q), lambda: self.ink(q).mean(axis=1))
+
+    def col_density(self, q):
+        return self._memo(("cols", q), lambda: self.ink(q).mean(axis=0))
 
 def set_region_y_from_px(region, y_top_px, y_bottom_px, height, origin):
     y_top_px = max(0, min(height, y_top_px))
@@ -102,40 +199,34 @@ def set_region_box_from_px(region, x_min_px, x_max_px, y_top_px, y_bottom_px, wi
     }
 
 
-def tighten_to_ink(image, padding=12, min_ink_ratio=0.003):
-    gray = np.array(image.convert("L"))
-    if gray.size == 0:
-        return image
-    thresh = np.percentile(gray, 30)
-    ink = gray < thresh
+def tighten_to_ink(view, padding=12, min_ink_ratio=0.003):
+    if view.size == 0:
+        return view
+    ink = view.ink(30)
     ink_ratio = ink.mean()
     if ink_ratio < min_ink_ratio:
-        return image
-    coords = np.column_stack(np.where(ink))
-    y_min, x_min = coords.min(axis=0)
-    y_max, x_max = coords.max(axis=0)
-    y_min = max(0, y_min - padding)
-    x_min = max(0, x_min - padding)
-    y_max = min(gray.shape[0], y_max + padding)
-    x_max = min(gray.shape[1], x_max + padding)
+        return view
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    y_min = max(0, int(rows[0]) - padding)
+    x_min = max(0, int(cols[0]) - padding)
+    y_max = min(view.height, int(rows[-1]) + padding)
+    x_max = min(view.width, int(cols[-1]) + padding)
     if y_max <= y_min or x_max <= x_min:
-        return image
-    return image.crop((x_min, y_min, x_max, y_max))
-
-def crop_to_band(image, band_height_ratio=0.5, avoid_bottom_ratio=0.2):
-    gray = np.array(image.convert("L"))
-    if gray.size == 0:
-        return image
-    thresh = np.percentile(gray, 35)
-    ink = gray < thresh
-    row_density = ink.mean(axis=1)
+        return view
+    return view.crop(x_min, y_min, x_max, y_max)
+
+def crop_to_band(view, band_height_ratio=0.5, avoid_bottom_ratio=0.2):
+    if view.size == 0:
+        return view
+    row_density = view.row_density(35)
     total_rows = row_density.shape[0]
     if total_rows == 0:
-        return image
+        return view
     start_row = int(total_rows * 0.05)
     end_row = int(total_rows * (1.0 - avoid_bottom_ratio))
     if end_row <= start_row:
-        return image
+        return view
     target = row_density[start_row:end_row]
     peak_index = int(np.argmax(target)) + start_row
     band_height = max(1, int(total_rows * band_height_ratio))
@@ -143,38 +234,33 @@ def crop_to_band(image, band_height_ratio=0.5, avoid_bottom_ratio=0.2):
     y_min = max(0, peak_index - half)
     y_max = min(total_rows, peak_index + half)
     if y_max <= y_min:
-        return image
-    return image.crop((0, y_min, gray.shape[1], y_max))
+        return view
+    return view.crop(0, y_min, view.width, y_max)
 
 
-def trim_right_block(image, right_ratio=0.3, density_threshold=0.08, padding=8):
-    gray = np.array(image.convert("L"))
-    if gray.size == 0:
-        return image
-    thresh = np.percentile(gray, 35)
-    ink = gray < thresh
-    col_density = ink.mean(axis=0)
+def trim_right_block(view, right_ratio=0.3, density_threshold=0.08, padding=8):
+    if view.size == 0:
+        return view
+    col_density = view.col_density(35)
     width = col_density.shape[0]
     if width == 0:
-        return image
+        return view
     right_start = int(width * (1.0 - right_ratio))
     right_density = col_density[right_start:]
     if right_density.size == 0:
-        return image
+        return view
     hit_indices = np.where(right_density > density_threshold)[0]
     if hit_indices.size == 0:
-        return image
+        return view
     block_start = right_start + int(hit_indices.min())
     x_max = max(1, block_start - padding)
     if x_max <= 0:
-        return image
-    return image.crop((0, 0, x_max, gray.shape[0]))
+        return view
+    return view.crop(0, 0, x_max, view.height)
 
 
-def find_underline_row(gray, min_density=0.3):
-    thresh = np.percentile(gray, 35)
-    ink = gray < thresh
-    row_density = ink.mean(axis=1)
+def find_underline_row(view, min_density=0.3):
+    row_density = view.row_density(35)
     if row_density.size == 0:
         return None
     max_idx = int(np.argmax(row_density))
@@ -183,45 +269,98 @@ def find_underline_row(gray, min_density=0.3):
     return max_idx
 
 
-def refine_legal_crop(crop):
-    gray = np.array(crop.convert("L"))
-    if gray.size == 0:
-        return crop
-    underline = find_underline_row(gray, min_density=0.25)
-    if underline is not None:
-        top = max(0, underline - int(gray.shape[0] * 0.6))
-        bottom = min(gray.shape[0], underline + int(gray.shape[0] * 0.15))
-        if bottom > top:
-            crop = crop.crop((0, top, gray.shape[1], bottom))
-    crop = trim_right_block(crop, right_ratio=0.25, density_threshold=0.06, padding=6)
-    return crop
+# refine_legal_crop and refine_numeric_crop return the refined view plus the printed structure they
+# found (page pixel positions); passing that structure back in replays it instead of searching.
 
 
-def refine_numeric_crop(crop):
-    gray = np.array(crop.convert("L"))
-    if gray.size == 0:
-        return crop
-    thresh = np.percentile(gray, 35)
-    ink = gray < thresh
-    col_density = ink.mean(axis=0)
-    width = col_density.shape[0]
-    if width == 0:
-        return crop
-    left_band = col_density[: max(1, int(width * 0.35))]
-    peak = int(np.argmax(left_band))
-    if left_band[peak] > 0.05:
-        x_min = min(width - 1, peak + int(width * 0.04))
-        crop = crop.crop((x_min, 0, width, gray.shape[0]))
-    crop = crop_to_band(crop, band_height_ratio=0.45, avoid_bottom_ratio=0.25)
-    return crop
+def refine_legal_crop(view, structure=None):
+    if view.size == 0:
+        return view, structure
+    search = structure is None
+    if search:
+        underline = find_underline_row(view, min_density=0.25)
+        structure = {"underline": None if underline is None else view.top + underline, "right": None}
+    if structure["underline"] is not None:
+        underline = structure["underline"] - view.top
+        top = max(0, underline - int(view.height * 0.6))
+        bottom = min(view.height, underline + int(view.height * 0.15))
+        if bottom > top:
+            view = view.crop(0, top, view.width, bottom)
+    if search:
+        trimmed = trim_right_block(view, right_ratio=0.25, density_threshold=0.06, padding=6)
+        if trimmed.width < view.width:
+            structure["right"] = view.left + trimmed.width
+        view = trimmed
+    elif structure["right"] is not None and 0 < structure["right"] - view.left < view.width:
+        view = view.crop(0, 0, structure["right"] - view.left, view.height)
+    return view, structure
+
+
+def refine_numeric_crop(view, structure=None):
+    if view.size == 0:
+        return view, structure
+    if structure is None:
+        structure = {"left": None}
+        col_density = view.col_density(35)
+        width = col_density.shape[0]
+        if width == 0:
+            return view, structure
+        left_band = col_density[: max(1, int(width * 0.35))]
+        peak = int(np.argmax(left_band))
+        if left_band[peak] > 0.05:
+            structure["left"] = view.left + min(width - 1, peak + int(width * 0.04))
+    if structure["left"] is not None and 0 <= structure["left"] - view.left < view.width:
+        view = view.crop(structure["left"] - view.left, 0, view.width, view.height)
+    view = crop_to_band(view, band_height_ratio=0.45, avoid_bottom_ratio=0.25)
+    return view, structure
+
+
+def has_ink(view, min_ink_ratio=0.003):
+    # Absolute threshold, as in layout_signature: a blank crop has no pixels below it at all.
+    return view.size > 0 and (view.gray < 128).mean() >= min_ink_ratio
+
+
+def replay_or_refine(refine, view, structure):
+    # A replayed structure that leaves no ink in the crop belongs to another layout; search this page instead.
+    refined, found = refine(view, structure)
+    if structure is not None and not has_ink(refined):
+        refined, found = refine(view, None)
+        return refined, found, True
+    return refined, found, False
+
+
+def preprocess_gray(gray):
+    # ImageOps.autocontrast, ImageEnhance.Contrast(2.0) and ImageFilter.SHARPEN on a uint8 page, bit for bit:
+    # both point operations fold into one lookup table built from a single histogram, then one 3x3 pass.
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    levels = np.flatnonzero(histogram)
+    identity = np.arange(256, dtype=np.float64)
+    if levels.size and levels[-1] > levels[0]:
+        scale = 255.0 / (levels[-1] - levels[0])
+        stretch = np.clip((identity * scale - levels[0] * scale).astype(np.int64), 0, 255)
+    else:
+        stretch = identity.astype(np.int64)
+    # Contrast blends with the mean of the stretched page, which the histogram already gives.
+    mean = int(float((histogram * stretch).sum()) / max(1, gray.size) + 0.5)
+    enhanced = np.clip(2 * stretch - mean, 0, 255).astype(np.int16)[gray]
+    out = enhanced.astype(np.uint8)
+    if gray.shape[0] >= 3 and gray.shape[1] >= 3:
+        # SHARPEN is (32 * centre - 2 * neighbours) / 16, i.e. (34 * centre - 2 * box) / 16; PIL leaves the
+        # outermost rows and columns untouched.
+        box = enhanced[:, :-2] + enhanced[:, 1:-1]
+        box += enhanced[:, 2:]
+        box = box[:-2] + box[1:-1] + box[2:]
+        box *= -2
+        box += 34 * enhanced[1:-1, 1:-1]
+        box += 8
+        box >>= 4
+        np.clip(box, 0, 255, out=box)
+        out[1:-1, 1:-1] = box
+    return out
 
 
 def preprocess(image):
-    image = image.convert("L")
-    image = ImageOps.autocontrast(image)
-    image = ImageEnhance.Contrast(image).enhance(2.0)
-    image = image.filter(ImageFilter.SHARPEN)
-    return image.convert("RGB")
+    return Image.fromarray(preprocess_gray(np.asarray(image if image.mode == "L" else image.convert("L"))))
 
 
 def find_check_bounds(gray, padding=0):
@@ -250,17 +389,181 @@ def find_check_bounds(gray, padding=0):
     return (x_min, y_min, x_max, y_max)
 
 
-def estimate_skew_angle(gray, max_angle=3, step=0.5, band_ratio=0.2, scale=0.4):
+def ink_runs(profile, min_count, min_gap):
+    # [start, end) runs of the profile at or above min_count, split only at gaps of at least min_gap.
+    index = np.flatnonzero(profile >= min_count)
+    if index.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(index) > min_gap)
+    starts = np.concatenate(([index[0]], index[breaks + 1]))
+    ends = np.concatenate((index[breaks], [index[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def tight_ink_box(ink, box, min_count):
+    x0, y0, x1, y1 = box
+    view = ink[y0:y1, x0:x1]
+    rows = np.flatnonzero(view.sum(axis=1) >= min_count)
+    cols = np.flatnonzero(view.sum(axis=0) >= min_count)
+    if rows.size == 0 or cols.size == 0:
+        return None
+    return (x0 + int(cols[0]), y0 + int(rows[0]), x0 + int(cols[-1]) + 1, y0 + int(rows[-1]) + 1)
+
+
+def is_check_shaped(box, min_width, min_aspect=1.4, max_aspect=3.6):
+    # Personal and business checks are 2.2-2.5 times as wide as tall; a band cut out of one is not, and
+    # neither is a page number or stamp, which is far narrower than any check on the page.
+    width, height = box[2] - box[0], box[3] - box[1]
+    return height > 0 and width >= min_width and min_aspect <= width / float(height) <= max_aspect
+
+
+def split_checks(ink, box, min_count, min_gap, min_width, memo):
+    # Check boxes tiling `box`, or None when it cannot be split into check-shaped pieces. Blank bands are
+    # tried widest first; a band inside a borderless check leaves a piece that is not check-shaped, so
+    # the cut falls through to the next band and finally to keeping the box whole.
+    if box in memo:
+        return memo[box]
+    x0, y0, x1, y1 = box
+    view = ink[y0:y1, x0:x1]
+    gaps = []
+    for axis, profile in ((0, view.sum(axis=1)), (1, view.sum(axis=0))):
+        runs = ink_runs(profile, min_count, min_gap)
+        gaps.extend((start - end, axis, end, start) for (_, end), (start, _) in zip(runs, runs[1:]))
+    result = [box] if is_check_shaped(box, min_width) else None
+    for _, axis, gap_start, gap_end in sorted(gaps, reverse=True):
+        if axis == 0:
+            halves = ((x0, y0, x1, y0 + gap_start), (x0, y0 + gap_end, x1, y1))
+        else:
+            halves = ((x0, y0, x0 + gap_start, y1), (x0 + gap_end, y0, x1, y1))
+        cells = []
+        for half in halves:
+            half = tight_ink_box(ink, half, min_count)
+            # Dust and stray marks are dropped rather than allowed to veto a split.
+            if half is None or int(ink[half[1] : half[3], half[0] : half[2]].sum()) < min_gap:
+                continue
+            found = split_checks(ink, half, min_count, min_gap, min_width, memo)
+            if found is None:
+                cells = None
+                break
+            cells.extend(found)
+        if cells:
+            result = cells
+            break
+    memo[box] = result
+    return result
+
+
+def find_check_rects(gray, min_gap_ratio=0.015, min_width_ratio=0.2, min_area_ratio=0.25, work_size=600, ink_threshold=160):
+    # Rectangles of the separate checks on a flatbed page, in reading order and page pixels; an empty
+    # list when the page holds a single check. Ink (text, rules and printed borders) is max-pooled to
+    # about work_size px on the long side so thin borders survive, then cut along blank bands of the
+    # row and column ink profiles.
+    height, width = gray.shape
+    factor = max(1, int(math.ceil(max(height, width) / float(work_size))))
+    small_height, small_width = height // factor, width // factor
+    if small_height < 8 or small_width < 8:
+        return []
+    ink = gray[: small_height * factor, : small_width * factor] < ink_threshold
+    ink = ink.reshape(small_height, factor, small_width, factor).any(axis=(1, 3))
+    min_gap = max(2, int(round(min_gap_ratio * max(small_height, small_width))))
+    page = tight_ink_box(ink, (0, 0, small_width, small_height), 2)
+    cells = split_checks(ink, page, 2, min_gap, min_width_ratio * small_width, {}) if page else None
+    if cells:
+        largest = max((cell[2] - cell[0]) * (cell[3] - cell[1]) for cell in cells)
+        cells = [cell for cell in cells if (cell[2] - cell[0]) * (cell[3] - cell[1]) >= min_area_ratio * largest]
+    if not cells or len(cells) < 2:
+        return []
+    row_height = float(np.median([cell[3] - cell[1] for cell in cells]))
+    cells.sort(key=lambda cell: (int((cell[1] + cell[3]) / 2.0 // row_height), cell[0]))
+    # Half the minimum gap of margin keeps each rectangle clear of its neighbours' ink.
+    pad = min_gap // 2
+    return [
+        (
+            max(0, (x0 - pad) * factor),
+            max(0, (y0 - pad) * factor),
+            min(width, (x1 + pad) * factor),
+            min(height, (y1 + pad) * factor),
+        )
+        for x0, y0, x1, y1 in cells
+    ]
+
+
+def downscale_gray(gray, scale):
     height, width = gray.shape
-    if height == 0 or width == 0:
-        return 0.0
     if scale and 0 < scale < 1:
         small = Image.fromarray(gray).resize(
             (max(1, int(width * scale)), max(1, int(height * scale))),
             resample=Image.BILINEAR,
         )
-        gray = np.array(small)
-        height, width = gray.shape
+        return np.array(small)
+    return gray
+
+
+def skew_projection_scores(ys, xs, angles, height, width, band_height):
+    # Row-density variance of the bottom band after rotating the ink points by each angle (as Image.rotate(expand=True)).
+    cx = width / 2.0
+    cy = height / 2.0
+    scores = []
+    for angle in angles:
+        theta = np.deg2rad(angle)
+        cos_t = np.cos(theta)
+        sin_t = np.sin(theta)
+        rot_width = width * abs(cos_t) + height * abs(sin_t)
+        rot_height = width * abs(sin_t) + height * abs(cos_t)
+        rows = np.floor((ys - cy) * cos_t - (xs - cx) * sin_t + rot_height / 2.0).astype(np.int64)
+        band_top = int(np.ceil(rot_height)) - band_height
+        rows = rows[(rows >= band_top) & (rows < band_top + band_height)] - band_top
+        counts = np.bincount(rows, minlength=band_height)
+        scores.append(float((counts / max(1.0, rot_width)).var()))
+    return scores
+
+
+def estimate_skew_angle_projection(gray, max_angle=3, step=0.5, band_ratio=0.2, scale=0.4):
+    height, width = gray.shape
+    if height == 0 or width == 0:
+        return 0.0
+    gray = downscale_gray(gray, scale)
+    height, width = gray.shape
+
+    band_height = max(1, int(height * band_ratio))
+    # Ink is thresholded once on the bottom band plus the rows a rotation of max_angle can bring into it.
+    margin = int(np.ceil(width * np.tan(np.deg2rad(abs(max_angle))))) + 1
+    band_start = max(0, height - band_height - margin)
+    band = PageAnalysis(gray).crop(0, band_start, width, height)
+    ys, xs = np.nonzero(band.ink(35))
+    if ys.size == 0:
+        return 0.0
+    ys = ys.astype(np.float64) + band_start + 0.5
+    xs = xs.astype(np.float64) + 0.5
+
+    angles = np.arange(-max_angle, max_angle + step, step)
+    scores = skew_projection_scores(ys, xs, angles, height, width, band_height)
+    baseline_score = skew_projection_scores(ys, xs, [0.0], height, width, band_height)[0]
+    best = int(np.argmax(scores))
+    best_angle = float(angles[best])
+    best_score = scores[best]
+
+    # Coarse-to-fine: a second sweep at a quarter step around the best coarse angle.
+    fine = np.arange(best_angle - step, best_angle + step + step / 8.0, step / 4.0)
+    fine = fine[np.abs(fine) <= abs(max_angle) + 1e-9]
+    if fine.size:
+        fine_scores = skew_projection_scores(ys, xs, fine, height, width, band_height)
+        fine_best = int(np.argmax(fine_scores))
+        if fine_scores[fine_best] > best_score:
+            best_angle = float(fine[fine_best])
+            best_score = fine_scores[fine_best]
+
+    if best_score - baseline_score < 0.0005:
+        return 0.0
+    return round(best_angle, 4)
+
+
+def estimate_skew_angle(gray, max_angle=3, step=0.5, band_ratio=0.2, scale=0.4):
+    height, width = gray.shape
+    if height == 0 or width == 0:
+        return 0.0
+    gray = downscale_gray(gray, scale)
+    height, width = gray.shape
 
     band_height = max(1, int(height * band_ratio))
     angles = np.arange(-max_angle, max_angle + step, step)
@@ -289,60 +592,121 @@ def estimate_skew_angle(gray, max_angle=3, step=0.5, band_ratio=0.2, scale=0.4):
     return float(best_angle)
 
 
-def align_check(image, enabled, padding, max_angle, step, band_ratio, scale):
+DESKEW_METHODS = {
+    "projection": estimate_skew_angle_projection,
+    "rotate": estimate_skew_angle,
+}
+
+
+def align_check(image, enabled, padding, max_angle, step, band_ratio, scale, gray=None, method="projection"):
+    # Also returns the crop/rotate/crop that was applied (None when disabled) so it can be replayed
+    # on a higher-resolution copy of the page.
+    if gray is None:
+        gray = np.array(image if image.mode == "L" else image.convert("L"))
     if not enabled:
-        return image
-    gray = np.array(image.convert("L"))
+        return image, gray, None
     bounds = find_check_bounds(gray, padding=padding)
     x_min, y_min, x_max, y_max = bounds
-    cropped = image.crop((x_min, y_min, x_max, y_max))
-    gray_crop = np.array(cropped.convert("L"))
-    angle = estimate_skew_angle(gray_crop, max_angle=max_angle, step=step, band_ratio=band_ratio, scale=scale)
+    cropped = image.crop(bounds)
+    gray_crop = gray[y_min:y_max, x_min:x_max]
+    estimator = DESKEW_METHODS.get(method, estimate_skew_angle_projection)
+    angle = estimator(gray_crop, max_angle=max_angle, step=step, band_ratio=band_ratio, scale=scale)
     if abs(angle) < 0.1:
-        return cropped
+        return cropped, gray_crop, {"bounds": bounds, "angle": 0.0, "trim": None}
     rotated = cropped.rotate(angle, expand=True, fillcolor="white")
-    gray_rot = np.array(rotated.convert("L"))
-    x_min, y_min, x_max, y_max = find_check_bounds(gray_rot, padding=padding)
-    return rotated.crop((x_min, y_min, x_max, y_max))
+    gray_rot = np.array(rotated if rotated.mode == "L" else rotated.convert("L"))
+    trim = find_check_bounds(gray_rot, padding=padding)
+    x_min, y_min, x_max, y_max = trim
+    alignment = {"bounds": bounds, "angle": angle, "trim": trim}
+    return rotated.crop(trim), gray_rot[y_min:y_max, x_min:x_max], alignment
+
+
+def rotation_matrix(width, height, angle):
+    # The output-to-input affine Image.rotate(angle, expand=True) uses for a width x height image.
+    radians = -math.radians(angle)
+    a = round(math.cos(radians), 15)
+    b = round(math.sin(radians), 15)
+    d, e = -b, a
+    center_x, center_y = width / 2.0, height / 2.0
+    c = -a * center_x - b * center_y + center_x
+    f = -d * center_x - e * center_y + center_y
+    corners = [(a * x + b * y + c, d * x + e * y + f) for x, y in ((0, 0), (width, 0), (width, height), (0, height))]
+    new_width = math.ceil(max(x for x, _ in corners)) - math.floor(min(x for x, _ in corners))
+    new_height = math.ceil(max(y for _, y in corners)) - math.floor(min(y for _, y in corners))
+    shift_x, shift_y = -(new_width - width) / 2.0, -(new_height - height) / 2.0
+    return (a, b, a * shift_x + b * shift_y + c, d, e, d * shift_x + e * shift_y + f)
+
+
+def cut_aligned_region(source, alignment, box, factor):
+    # Samples one region of the aligned page straight from the unaligned source, which is `factor`
+    # times the resolution alignment ran at: a single affine pass over the region's pixels instead
+    # of rotating the whole full-resolution page.
+    x_min = int(math.floor(box[0] * factor))
+    y_min = int(math.floor(box[1] * factor))
+    x_max = max(x_min + 1, int(math.ceil(box[2] * factor)))
+    y_max = max(y_min + 1, int(math.ceil(box[3] * factor)))
+    matrix = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+    offset_x = offset_y = 0
+    if alignment is not None:
+        bounds = [int(round(value * factor)) for value in alignment["bounds"]]
+        offset_x, offset_y = bounds[0], bounds[1]
+        if alignment["trim"] is not None:
+            matrix = rotation_matrix(bounds[2] - bounds[0], bounds[3] - bounds[1], alignment["angle"])
+            x_min += int(round(alignment["trim"][0] * factor))
+            y_min += int(round(alignment["trim"][1] * factor))
+            x_max += int(round(alignment["trim"][0] * factor))
+            y_max += int(round(alignment["trim"][1] * factor))
+    a, b, c, d, e, f = matrix
+    data = (a, b, a * x_min + b * y_min + c + offset_x, d, e, d * x_min + e * y_min + f + offset_y)
+    return source.transform((x_max - x_min, y_max - y_min), Image.AFFINE, data, resample=Image.NEAREST, fillcolor="white")
+
+
+def longest_run(mask):
+    # (start, end) of the first longest run of True values, or None.
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    if starts.size == 0:
+        return None
+    ends = np.flatnonzero(edges == -1)
+    best = int(np.argmax(ends - starts))
+    return int(starts[best]), int(ends[best])
 
 
-def detect_micr_band(gray):
+def detect_micr_band(gray, band_ratio=0.2):
     height = gray.shape[0]
-    band_start = int(height * 0.8)
+    band_start = int(height * (1.0 - band_ratio))
     band = gray[band_start:height, :]
-    median = float(gray.mean())
-    diff = abs(gray.astype("float32") - median)
-    dev_thresh = float(np.percentile(diff, 75))
-    activity = (diff > dev_thresh).mean(axis=1)
-    if activity.size == 0:
+    if band.size == 0:
         return None
+    # Deviation from the band mean depends only on the pixel value, so it is a 256-entry table lookup.
+    mean = int(round(float(band.mean())))
+    deviation = np.abs(np.arange(256, dtype=np.int16) - mean).astype(np.uint8)
+    dev_counts = np.bincount(deviation[band].ravel(), minlength=256)
+    dev_thresh = gray_percentile(dev_counts, band.size, 75)
+    active_pixels = deviation > dev_thresh
+    activity = active_pixels[band].mean(axis=1)
     threshold = max(float(np.percentile(activity, 75)), 0.08)
 
-    best_start = None
-    best_end = None
-    current_start = None
-    for idx, value in enumerate(activity):
-        if value >= threshold:
-            if current_start is None:
-                current_start = idx
-        else:
-            if current_start is not None:
-                end = idx
-                if best_start is None or (end - current_start) > (best_end - best_start):
-                    best_start = current_start
-                    best_end = end
-                current_start = None
-    if current_start is not None:
-        end = activity.size
-        if best_start is None or (end - current_start) > (best_end - best_start):
-            best_start = current_start
-            best_end = end
-
-    if best_start is None:
+    run = longest_run(activity >= threshold)
+    if run is None:
         return None
-    micr_top = band_start + best_start
-    micr_bottom = band_start + best_end
-    return micr_top, micr_bottom
+    best_start, best_end = run
+
+    # Confidence: how much the run stands out from the rest of the band, discounted when
+    # the run is implausibly thin or fills most of the band.
+    inside = float(activity[best_start:best_end].mean())
+    outside_rows = np.concatenate((activity[:best_start], activity[best_end:]))
+    outside = float(outside_rows.mean()) if outside_rows.size else 0.0
+    prominence = clamp((inside - outside) / inside) if inside > 0 else 0.0
+    fill = (best_end - best_start) / float(activity.size)
+    if fill < 0.08:
+        shape_score = fill / 0.08
+    elif fill > 0.6:
+        shape_score = max(0.0, (1.0 - fill) / 0.4)
+    else:
+        shape_score = 1.0
+    confidence = round(prominence * shape_score, 3)
+    return band_start + best_start, band_start + best_end, confidence
 
 def tighten_micr_bounds(gray, micr_top, micr_bottom):
     height, width = gray.shape
@@ -350,17 +714,14 @@ def tighten_micr_bounds(gray, micr_top, micr_bottom):
     micr_bottom = max(0, min(height, micr_bottom))
     if micr_bottom <= micr_top:
         return micr_top, micr_bottom, 0, width
-    band = gray[micr_top:micr_bottom, :]
-    thresh = np.percentile(band, 35)
-    ink = band < thresh
+    ink = PageAnalysis(gray).crop(0, micr_top, width, micr_bottom).ink(35)
     if ink.mean() < 0.002:
         return micr_top, micr_bottom, 0, width
-    coords = np.column_stack(np.where(ink))
-    if coords.size == 0:
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if rows.size == 0:
         return micr_top, micr_bottom, 0, width
-    y_min, x_min = coords.min(axis=0)
-    y_max, x_max = coords.max(axis=0)
-    return micr_top + y_min, micr_top + y_max, x_min, x_max
+    return micr_top + int(rows[0]), micr_top + int(rows[-1]), int(cols[0]), int(cols[-1])
 
 
 def adjust_regions_for_micr(regions, micr_top_norm, micr_bottom_norm, anchor_region):
@@ -386,75 +747,312 @@ def adjust_regions_for_micr(regions, micr_top_norm, micr_bottom_norm, anchor_reg
     return adjusted
 
 
-def load_trocr(model_name):
-    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+def configure_model_env():
+    # torch, transformers and paddle are imported only when an engine is built; these must be set first.
+    os.environ["DISABLE_MODEL_SOURCE_CHECK"] = "True"
+    os.environ.setdefault("PADDLE_LOG_LEVEL", "ERROR")
+    os.environ.setdefault("TRANSFORMERS_VERBOSITY", "error")
+    os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
 
-    processor = TrOCRProcessor.from_pretrained(model_name)
-    model = VisionEncoderDecoderModel.from_pretrained(model_name)
-    return processor, model
+
+# Bump when the snapshot layout changes; older snapshots are then treated as stale.
+MODEL_SNAPSHOT_FORMAT = 1
 
 
-def trocr_ocr(image, processor, model):
-    pixel_values = processor(images=image, return_tensors="pt").pixel_values
-    generated_ids = model.generate(pixel_values)
-    return processor.batch_decode(generated_ids, skip_special_tokens=True)[0].strip()
+def model_snapshot_root(env=None):
+    env = os.environ if env is None else env
+    root = (env.get("OCR_MODEL_DIR") or "").strip()
+    return root or os.path.join((env.get("OCR_CACHE_DIR") or "").strip() or default_cache_dir(), "models")
 
 
-def paddle_ocr(image):
+def model_snapshot_dir(model_name, root):
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "--", model_name.strip("/\\")))
+
+
+def model_source_state(model_name):
+    # What the snapshot was built from: newest file mtime for a local model directory, otherwise the
+    # revision the local Hugging Face cache points at (read from disk, no network).
+    if os.path.isdir(model_name):
+        mtimes = [
+            os.path.getmtime(os.path.join(directory, name))
+            for directory, _, names in os.walk(model_name)
+            for name in names
+        ]
+        return {"sourceMtime": max(mtimes) if mtimes else None}
     try:
-        import numpy as np
-        from paddleocr import PaddleOCR
-    except Exception:
-        raise ImportError("paddleocr is not installed")
-
-    ocr = PaddleOCR(
-        use_textline_orientation=False,
-        lang="en",
-        text_det_thresh=0.1,
-        text_det_box_thresh=0.1,
-        text_det_unclip_ratio=1.6,
-        text_det_limit_side_len=2000,
-        text_det_limit_type="max",
-    )
-    image_array = np.array(image)
+        from huggingface_hub import constants
+    except ImportError:
+        return {"revision": None}
+    ref = os.path.join(constants.HF_HUB_CACHE, "models--" + model_name.replace("/", "--"), "refs", "main")
     try:
-        results = ocr.ocr(image_array) or []
-    except Exception:
-        try:
-            results = ocr.ocr(image) or []
-        except Exception:
-            return ""
+        with open(ref, "r", encoding="utf-8") as handle:
+            return {"revision": handle.read().strip() or None}
+    except OSError:
+        return {"revision": None}
 
-    pieces = []
-    for result in results:
-        for entry in result or []:
-            if not entry or len(entry) < 2:
-                continue
-            text_info = entry[1]
-            text = text_info[0] if text_info else ""
-            if text:
-                pieces.append(text)
-    return " ".join(pieces).strip()
 
+def read_model_snapshot(model_name, root):
+    path = model_snapshot_dir(model_name, root)
+    try:
+        with open(os.path.join(path, "snapshot.json"), "r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError):
+        return path, None, "missing"
+    if manifest.get("model") != model_name or manifest.get("format") != MODEL_SNAPSHOT_FORMAT:
+        return path, manifest, "stale"
+    current = model_source_state(model_name)
+    for name, value in current.items():
+        # An unknown current state (no local cache entry) does not invalidate the snapshot.
+        if value is not None and manifest.get(name) != value:
+            return path, manifest, "stale"
+    return path, manifest, "ok"
+
+
+def prepare_model_snapshot(model_name, root):
+    configure_model_env()
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 
-def can_use_paddle(errors):
+    processor = TrOCRProcessor.from_pretrained(model_name)
+    model = VisionEncoderDecoderModel.from_pretrained(model_name)
+    target = model_snapshot_dir(model_name, root)
+    os.makedirs(root, exist_ok=True)
+    # Written beside the target and swapped in, so a reader never sees a half-written snapshot.
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=root)
     try:
-        import paddleocr  # noqa: F401
-        return True
-    except Exception as exc:
-        errors.append(f"paddle: {exc}")
-        return False
+        model.save_pretrained(staging)
+        processor.save_pretrained(staging)
+        manifest = {
+            "model": model_name,
+            "format": MODEL_SNAPSHOT_FORMAT,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "transformers": package_version("transformers"),
+            "torch": package_version("torch"),
+            **model_source_state(model_name),
+        }
+        if manifest.get("revision") is None and not os.path.isdir(model_name):
+            manifest["revision"] = getattr(model.config, "_commit_hash", None)
+        with open(os.path.join(staging, "snapshot.json"), "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle, indent=2)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    size = sum(os.path.getsize(os.path.join(target, name)) for name in os.listdir(target))
+    return {**manifest, "path": target, "sizeMb": round(size / (1024.0 * 1024.0), 1)}
+
 
+def load_trocr(model_name, model_dir=None):
+    configure_model_env()
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 
-def micr_ocr_tesseract(image):
+    if model_dir:
+        path, _, state = read_model_snapshot(model_name, model_dir)
+        if state == "ok":
+            try:
+                # Local files only: no hub resolution, and the safetensors weights are memory-mapped.
+                processor = TrOCRProcessor.from_pretrained(path, local_files_only=True)
+                model = VisionEncoderDecoderModel.from_pretrained(path, local_files_only=True)
+                return processor, model
+            except Exception as exc:
+                print(f"model snapshot {path} unusable ({exc}); loading {model_name}", file=sys.stderr)
+        elif state == "stale":
+            print(f"model snapshot {path} is stale; loading {model_name} (re-run --prepare-model)", file=sys.stderr)
+    processor = TrOCRProcessor.from_pretrained(model_name)
+    model = VisionEncoderDecoderModel.from_pretrained(model_name)
+    return processor, model
+
+
+def load_trocr_fast(model_name, backend, export_dir, model_dir=None):
+    # "onnx" runs the exported encoder/decoder (with past key values) under ONNX Runtime; "int8" keeps
+    # PyTorch but dynamically quantizes every Linear layer. "auto" prefers ONNX when it is installed.
+    configure_model_env()
+    if backend == "auto":
+        backend = "onnx" if module_available("optimum", "onnxruntime") else "int8"
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForVision2Seq
+        from transformers import TrOCRProcessor
+
+        processor = TrOCRProcessor.from_pretrained(model_name)
+        # The export takes minutes, so it is written once per model and loaded from disk afterwards.
+        target = os.path.join(export_dir, re.sub(r"[^A-Za-z0-9._-]+", "--", model_name))
+        if os.path.exists(os.path.join(target, "config.json")):
+            model = ORTModelForVision2Seq.from_pretrained(target, use_cache=True)
+        else:
+            model = ORTModelForVision2Seq.from_pretrained(model_name, export=True, use_cache=True)
+            try:
+                model.save_pretrained(target)
+            except OSError:
+                pass
+        return processor, model, backend
+    if backend != "int8":
+        raise ValueError(f"unknown TrOCR backend {backend!r}")
+    import torch
+
+    processor, model = load_trocr(model_name, model_dir)
+    model = torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    return processor, model, backend
+
+
+_VOCABULARY_MASKS = {}
+
+
+def vocabulary_mask(processor, model, charset):
+    # Tokens whose text uses only the charset, plus end-of-sequence and padding. Built once per model.
+    import torch
+
+    tokenizer = processor.tokenizer
+    vocab_size = model.config.decoder.vocab_size
+    key = (id(tokenizer), vocab_size, charset)
+    mask = _VOCABULARY_MASKS.get(key)
+    if mask is None:
+        allowed = set(charset)
+        mask = torch.zeros(vocab_size, dtype=torch.bool)
+        tokens = tokenizer.convert_ids_to_tokens(list(range(min(vocab_size, len(tokenizer)))))
+        for index, token in enumerate(tokens):
+            text = tokenizer.convert_tokens_to_string([token]) if token is not None else ""
+            mask[index] = bool(text) and set(text) <= allowed
+        for token_id in (model.generation_config.eos_token_id, model.generation_config.pad_token_id):
+            for value in token_id if isinstance(token_id, list) else [token_id]:
+                if value is not None and value < vocab_size:
+                    mask[value] = True
+        _VOCABULARY_MASKS[key] = mask
+    return mask
+
+
+def charset_logits_processor(mask):
+    from transformers import LogitsProcessor, LogitsProcessorList
+
+    class CharsetLogitsProcessor(LogitsProcessor):
+        def __call__(self, input_ids, scores):
+            return scores.masked_fill(~mask[: scores.shape[-1]], float("-inf"))
+
+    return LogitsProcessorList([CharsetLogitsProcessor()])
+
+
+def trocr_generate_options(processor, model, profile, base=None):
+    options = dict(base or {})
+    profile = dict(profile or ())
+    if profile.get("maxNewTokens"):
+        options["max_new_tokens"] = int(profile["maxNewTokens"])
+    if profile.get("numBeams"):
+        options["num_beams"] = max(1, int(profile["numBeams"]))
+    if profile.get("charset"):
+        charset = CHARSETS.get(profile["charset"], profile["charset"])
+        options["logits_processor"] = charset_logits_processor(vocabulary_mask(processor, model, charset))
+    return options
+
+
+def trocr_pixel_values(crops, processor):
+    # The tensor TrOCRProcessor would build (resize to the encoder size, rescale, normalize, three equal
+    # channels), made straight from the grayscale crops: one antialiased bilinear resize per crop, then the
+    # rescale and normalization as a single batch op.
+    import torch
+    import torch.nn.functional as F
+
+    image_processor = getattr(processor, "image_processor", None)
+    if image_processor is None or not getattr(image_processor, "do_resize", True):
+        return processor(images=[crop.convert("RGB") for crop in crops], return_tensors="pt").pixel_values
+    size = image_processor.size
+    target = (int(size["height"]), int(size["width"]))
+    resized = []
+    for crop in crops:
+        pixels = torch.from_numpy(np.array(crop if crop.mode == "L" else crop.convert("L"), dtype=np.float32))
+        resized.append(F.interpolate(pixels[None, None], size=target, mode="bilinear", align_corners=False, antialias=True))
+    batch = torch.cat(resized).round_().clamp_(0, 255).expand(-1, 3, -1, -1)
+    if getattr(image_processor, "do_rescale", True):
+        batch = batch * float(image_processor.rescale_factor)
+    if getattr(image_processor, "do_normalize", True):
+        mean = torch.tensor(image_processor.image_mean, dtype=batch.dtype).view(1, 3, 1, 1)
+        std = torch.tensor(image_processor.image_std, dtype=batch.dtype).view(1, 3, 1, 1)
+        batch = (batch - mean) / std
+    return batch.contiguous()
+
+
+def group_by_profile(profiles, count):
+    groups = {}
+    for index, profile in enumerate(profiles or [None] * count):
+        groups.setdefault(profile, []).append(index)
+    return groups
+
+
+def trocr_ocr_batch(images, processor, model, max_batch_size=16, scores=False, generate_options=None, profiles=None):
+    import torch
+
+    results = [None] * len(images)
+    max_batch_size = max(1, int(max_batch_size or 1))
+    pad_token_id = model.generation_config.pad_token_id
+    # Crops sharing a generation profile decode together; each profile is its own generate call.
+    for profile, indices in group_by_profile(profiles, len(images)).items():
+        options = trocr_generate_options(processor, model, profile, generate_options)
+        for start in range(0, len(indices), max_batch_size):
+            chunk_indices = indices[start : start + max_batch_size]
+            # Every crop is resized to the encoder's input size, so the chunk stacks into one tensor.
+            pixel_values = trocr_pixel_values([images[index] for index in chunk_indices], processor)
+            with torch.no_grad():
+                if not scores:
+                    generated_ids = model.generate(pixel_values, **options)
+                    texts = processor.batch_decode(generated_ids, skip_special_tokens=True)
+                    for index, text in zip(chunk_indices, texts):
+                        results[index] = (text.strip(), None)
+                    continue
+                output = model.generate(pixel_values, output_scores=True, return_dict_in_generate=True, **options)
+                if options.get("num_beams", 1) > 1:
+                    confidences = torch.exp(output.sequences_scores).tolist()
+                else:
+                    token_scores = model.compute_transition_scores(output.sequences, output.scores, normalize_logits=True)
+                    # Confidence is the geometric mean probability of the generated tokens, padding excluded.
+                    mask = output.sequences[:, 1:] != pad_token_id
+                    log_probs = torch.where(mask, token_scores, torch.zeros_like(token_scores)).sum(dim=1)
+                    counts = mask.sum(dim=1).clamp(min=1)
+                    confidences = torch.exp(log_probs / counts).tolist()
+            texts = processor.batch_decode(output.sequences, skip_special_tokens=True)
+            for index, text, confidence in zip(chunk_indices, texts, confidences):
+                results[index] = (text.strip(), round(confidence, 4))
+    return results
+
+
+def paddle_result_entries(result):
+    # PaddleOCR 3.x returns dict-like results; 2.x returns [box, (text, score)] entries per line.
+    if hasattr(result, "get") and result.get("rec_texts") is not None:
+        texts = result.get("rec_texts") or []
+        scores = list(result.get("rec_scores") or [])
+        scores += [None] * (len(texts) - len(scores))
+        return [(text, score) for text, score in zip(texts, scores) if text]
+    entries = []
+    for entry in result or []:
+        if not entry or len(entry) < 2:
+            continue
+        text_info = entry[1]
+        text = text_info[0] if text_info else ""
+        score = text_info[1] if text_info and len(text_info) > 1 else None
+        if text:
+            entries.append((text, score))
+    return entries
+
+
+def join_paddle_entries(entries):
+    text = " ".join(text for text, _ in entries).strip()
+    scores = [float(score) for _, score in entries if score is not None]
+    return text, (round(sum(scores) / len(scores), 4) if scores else None)
+
+
+def micr_tess_variables(micr_lang):
+    if micr_lang == "eng":
+        return {"tessedit_char_whitelist": "0123456789", "classify_bln_numeric_mode": "1"}
+    return {}
+
+
+def micr_ocr_tesseract(image, micr_lang=None):
     try:
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-            image.save(tmp.name, format="PNG")
-            tmp_path = tmp.name
-        micr_lang = os.environ.get("MICR_TESS_LANG", "").strip() or "eng"
+        if micr_lang is None:
+            micr_lang = os.environ.get("MICR_TESS_LANG", "").strip() or "eng"
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
         base_args = [
             "tesseract",
-            tmp_path,
+            "stdin",
             "stdout",
             "-l",
             micr_lang,
@@ -464,228 +1062,1995 @@ def micr_ocr_tesseract(image):
             "1",
         ]
         config_args = []
-        if micr_lang == "eng":
-            config_args = [
-                "-c",
-                "tessedit_char_whitelist=0123456789",
-                "-c",
-                "classify_bln_numeric_mode=1",
-            ]
+        for name, value in micr_tess_variables(micr_lang).items():
+            config_args.extend(["-c", f"{name}={value}"])
         result = subprocess.run(
             base_args + config_args,
+            input=buffer.getvalue(),
             capture_output=True,
-            text=True,
             check=False,
         )
-        return result.stdout.strip()
+        return result.stdout.decode("utf-8", errors="replace").strip()
     except Exception:
         return ""
-    finally:
+
+
+def trocr_ocr_alternatives(images, processor, model, count, generate_options=None, profiles=None, max_batch_size=16):
+    import torch
+
+    results = [None] * len(images)
+    max_batch_size = max(1, int(max_batch_size or 1))
+    for profile, indices in group_by_profile(profiles, len(images)).items():
+        options = trocr_generate_options(processor, model, profile, generate_options)
+        options.update({"num_beams": max(count, options.get("num_beams", 1)), "num_return_sequences": count})
+        for start in range(0, len(indices), max_batch_size):
+            chunk_indices = indices[start : start + max_batch_size]
+            pixel_values = trocr_pixel_values([images[index] for index in chunk_indices], processor)
+            with torch.no_grad():
+                output = model.generate(pixel_values, output_scores=True, return_dict_in_generate=True, **options)
+            texts = [text.strip() for text in processor.batch_decode(output.sequences, skip_special_tokens=True)]
+            confidences = torch.exp(output.sequences_scores).tolist()
+            for position, index in enumerate(chunk_indices):
+                span = range(position * count, (position + 1) * count)
+                results[index] = [(texts[item], round(confidences[item], 4)) for item in span]
+    return results
+
+
+class TrocrEngine:
+    name = "trocr"
+
+    def __init__(self, model_name, max_new_tokens=None, model_dir=None):
+        self.model_name = model_name
+        self.processor, self.model = load_trocr(model_name, model_dir)
+        self.generate_options = {"max_new_tokens": max_new_tokens} if max_new_tokens else {}
+
+    def recognize(self, crops, batch_size=None, scores=False, profiles=None):
+        return trocr_ocr_batch(
+            crops,
+            self.processor,
+            self.model,
+            batch_size or 16,
+            scores=scores,
+            generate_options=self.generate_options,
+            profiles=profiles,
+        )
+
+    def alternatives(self, crops, count, profiles=None, batch_size=None):
+        return trocr_ocr_alternatives(
+            crops, self.processor, self.model, count, self.generate_options, profiles, batch_size or 16
+        )
+
+
+class TrocrFastEngine(TrocrEngine):
+    name = "trocr-onnx"
+
+    def __init__(self, model_name, backend="auto", max_new_tokens=None, export_dir=None, model_dir=None):
+        self.model_name = model_name
+        self.processor, self.model, self.backend = load_trocr_fast(model_name, backend, export_dir, model_dir)
+        # Check fields are a handful of tokens; a tight cap stops runaway decodes on noisy crops.
+        self.generate_options = {"max_new_tokens": max_new_tokens or 24, "use_cache": True}
+
+
+class PaddleEngine:
+    name = "paddle"
+
+    def __init__(self):
+        configure_model_env()
         try:
-            os.unlink(tmp_path)
+            from paddleocr import PaddleOCR
         except Exception:
+            raise ImportError("paddleocr is not installed")
+
+        self.ocr = PaddleOCR(
+            use_textline_orientation=False,
+            lang="en",
+            text_det_thresh=0.1,
+            text_det_box_thresh=0.1,
+            text_det_unclip_ratio=1.6,
+            text_det_limit_side_len=2000,
+            text_det_limit_type="max",
+        )
+
+    def recognize_one(self, crop):
+        try:
+            results = self.ocr.ocr(np.array(crop.convert("RGB"))) or []
+        except Exception:
+            try:
+                results = self.ocr.ocr(crop.convert("RGB")) or []
+            except Exception:
+                return "", None
+        entries = []
+        for result in results:
+            entries.extend(paddle_result_entries(result))
+        return join_paddle_entries(entries)
+
+    def recognize(self, crops, batch_size=None, scores=False, profiles=None):
+        if not crops:
+            return []
+        # PaddleOCR 3.x predicts a list of inputs in one pass; older releases take one image per call.
+        if hasattr(self.ocr, "predict"):
+            try:
+                results = self.ocr.predict([np.array(crop.convert("RGB")) for crop in crops])
+                results = list(results or [])
+                if len(results) == len(crops):
+                    return [join_paddle_entries(paddle_result_entries(result)) for result in results]
+            except Exception:
+                pass
+        return [self.recognize_one(crop) for crop in crops]
+
+
+class TesseractEngine:
+    name = "tesseract"
+
+    def __init__(self, micr_lang="eng"):
+        self.micr_lang = micr_lang
+        self.api = None
+        # tesserocr keeps one initialised API handle in-process; without it each crop goes through the CLI.
+        try:
+            from tesserocr import OEM, PSM, PyTessBaseAPI
+
+            self.api = PyTessBaseAPI(lang=micr_lang, psm=PSM.SINGLE_LINE, oem=OEM.LSTM_ONLY)
+            for name, value in micr_tess_variables(micr_lang).items():
+                self.api.SetVariable(name, value)
+        except Exception:
+            self.api = None
+
+    def recognize(self, crops, batch_size=None, scores=False, profiles=None):
+        if self.api is None:
+            return [(micr_ocr_tesseract(crop, self.micr_lang), None) for crop in crops]
+        results = []
+        for crop in crops:
+            try:
+                self.api.SetImage(crop)
+                text = self.api.GetUTF8Text().strip()
+                results.append((text, round(self.api.MeanTextConf() / 100.0, 4)))
+            except Exception:
+                results.append((micr_ocr_tesseract(crop, self.micr_lang), None))
+        return results
+
+
+ENGINE_TYPES = {
+    "trocr": TrocrEngine,
+    "trocr-onnx": TrocrFastEngine,
+    "paddle": PaddleEngine,
+    "tesseract": TesseractEngine,
+}
+
+# Candidate order for text regions; selection ties go to the later engine.
+TEXT_ENGINES = ("trocr", "trocr-onnx", "paddle")
+
+_ENGINE_REGISTRY = {}
+
+
+def get_engine(name, **options):
+    # Each engine is built once per process and options set, then reused across pages and requests.
+    key = (name, tuple(sorted(options.items())))
+    engine = _ENGINE_REGISTRY.get(key)
+    if engine is None:
+        engine = ENGINE_TYPES[name](**options)
+        _ENGINE_REGISTRY[key] = engine
+    return engine
+
+
+def loaded_engines():
+    return sorted(
+        name + "".join(f":{value}" for _, value in options) for name, options in _ENGINE_REGISTRY
+    )
+
+
+def default_cache_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "handwriting_ocr")
+
+
+def parse_worker_count(raw):
+    raw = (raw or "").strip().lower()
+    if raw and raw != "auto":
+        try:
+            return max(1, int(raw))
+        except ValueError:
             pass
+    return max(1, min(4, (os.cpu_count() or 1) // 2))
 
 
-def build_payload(image_path):
-    regions = load_regions()
-    engines = load_engines()
-    errors = []
-    include_previews = os.environ.get("OCR_DEBUG_IMAGES") == "1"
-    origin = os.environ.get("OCR_REGION_ORIGIN", "top-left").lower()
-    anchor = os.environ.get("OCR_REGION_ANCHOR", "none").lower()
-    model_name = os.environ.get("OCR_TROCR_MODEL", "").strip() or "microsoft/trocr-small-handwritten"
-    crop_max = os.environ.get("OCR_CROP_MAX_SIZE", "").strip()
-    preview_only = os.environ.get("OCR_PREVIEW_ONLY") == "1"
+PREVIEW_EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+
+def resolve_preview_format(raw):
+    name = (raw or "png").strip().lower()
+    name = "jpeg" if name == "jpg" else name
+    if name == "webp":
+        from PIL import features
+
+        if not features.check("webp"):
+            return "png"
+    return name if name in PREVIEW_EXTENSIONS else "png"
+
+
+def load_config(env=None):
+    env = os.environ if env is None else env
+    crop_max = (env.get("OCR_CROP_MAX_SIZE") or "").strip()
     try:
         crop_max = int(crop_max) if crop_max else None
     except ValueError:
         crop_max = None
+    return {
+        "regions": load_regions(env),
+        "engines": load_engines(env),
+        "include_previews": env.get("OCR_DEBUG_IMAGES") == "1",
+        "origin": (env.get("OCR_REGION_ORIGIN") or "top-left").lower(),
+        "anchor": (env.get("OCR_REGION_ANCHOR") or "none").lower(),
+        "model_name": (env.get("OCR_TROCR_MODEL") or "").strip() or "microsoft/trocr-small-handwritten",
+        "micr_lang": (env.get("MICR_TESS_LANG") or "").strip() or "eng",
+        "crop_max": crop_max,
+        "pdf_dpi": int(env.get("OCR_PDF_DPI") or 300),
+        "preview_only": env.get("OCR_PREVIEW_ONLY") == "1",
+        "align_enabled": env.get("OCR_ALIGN") == "1",
+        "bounds_padding": int(env.get("OCR_BOUNDS_PADDING") or 0),
+        "max_angle": float(env.get("OCR_DESKEW_MAX_ANGLE") or 3),
+        "angle_step": float(env.get("OCR_DESKEW_STEP") or 0.5),
+        "band_ratio": float(env.get("OCR_DESKEW_BAND") or 0.2),
+        "deskew_scale": float(env.get("OCR_DESKEW_SCALE") or 0.4),
+        "work_scale": clamp(float(env.get("OCR_WORK_SCALE") or 1), 0.05, 1.0),
+        "deskew_method": (env.get("OCR_DESKEW_METHOD") or "projection").lower(),
+        "micr_min_confidence": float(env.get("OCR_MICR_MIN_CONFIDENCE") or 0),
+        "workers": parse_worker_count(env.get("OCR_WORKERS")),
+        "torch_threads": int(env.get("OCR_TORCH_THREADS") or 0),
+        "trocr_batch_size": max(1, int(env.get("OCR_TROCR_BATCH_SIZE") or 16)),
+        "trocr_max_new_tokens": int(env.get("OCR_TROCR_MAX_NEW_TOKENS") or 0) or None,
+        "trocr_backend": (env.get("OCR_TROCR_BACKEND") or "auto").strip().lower(),
+        "cascade": env.get("OCR_CASCADE") == "1",
+        "cascade_threshold": float(env.get("OCR_CASCADE_MIN_CONFIDENCE") or 0.6),
+        "amount_check": env.get("OCR_AMOUNT_CHECK", "1") != "0",
+        "layout_mode": (env.get("OCR_LAYOUTS") or "0").strip().lower(),
+        "multi_check": env.get("OCR_MULTI_CHECK") == "1",
+        "amount_alternatives": max(2, int(env.get("OCR_AMOUNT_ALTERNATIVES") or 4)),
+        "cache_mode": (env.get("OCR_CACHE") or "1").strip().lower(),
+        "cache_dir": (env.get("OCR_CACHE_DIR") or "").strip() or default_cache_dir(),
+        "cache_max_mb": float(env.get("OCR_CACHE_MAX_MB") or 256),
+        # Where TrOCR snapshots from --prepare-model are read; None loads through the Hugging Face cache.
+        "model_dir": model_snapshot_root(env) if env.get("OCR_MODEL_SNAPSHOT") != "0" else None,
+        "preview_mode": (env.get("OCR_PREVIEW_MODE") or "inline").strip().lower(),
+        "preview_dir": (env.get("OCR_PREVIEW_DIR") or "").strip(),
+        "preview_format": resolve_preview_format(env.get("OCR_PREVIEW_FORMAT")),
+        "preview_quality": int(env.get("OCR_PREVIEW_QUALITY") or 70),
+        "preview_size": int(env.get("OCR_PREVIEW_SIZE") or 600),
+        "preview_page_size": int(env.get("OCR_PREVIEW_PAGE_SIZE") or 800),
+        "profile": env.get("OCR_PROFILE") == "1",
+        "profile_dir": (env.get("OCR_PROFILE_DUMP") or "").strip(),
+    }
+
+
+def new_timings(config):
+    return {"stages": {}, "regions": {}} if config["profile"] else None
+
+
+def add_timing(timings, path, wall, cpu):
+    bucket = timings
+    for name in path[:-1]:
+        bucket = bucket.setdefault(name, {})
+    entry = bucket.setdefault(path[-1], {"wallMs": 0.0, "cpuMs": 0.0, "calls": 0})
+    entry["wallMs"] += wall * 1000.0
+    entry["cpuMs"] += cpu * 1000.0
+    entry["calls"] += 1
+
+
+@contextmanager
+def timed(timings, *path):
+    if timings is None:
+        yield
+        return
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        add_timing(timings, path, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    scale = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def round_timings(value):
+    if isinstance(value, dict):
+        return {key: round_timings(item) for key, item in value.items()}
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+
+def start_profiler(config):
+    if not config["profile_dir"]:
+        return None
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def dump_profiler(profiler, config, label):
+    if profiler is None:
+        return
+    profiler.disable()
+    try:
+        os.makedirs(config["profile_dir"], exist_ok=True)
+        path = os.path.join(config["profile_dir"], f"ocr-{label}-{os.getpid()}-{int(time.time() * 1000)}.pstats")
+        profiler.dump_stats(path)
+        print(f"profile written to {path}", file=sys.stderr)
+    except OSError as exc:
+        print(f"profile dump failed: {exc}", file=sys.stderr)
+
+
+def engine_options(name, config):
+    if name == "trocr":
+        options = {"model_name": config["model_name"], "model_dir": config["model_dir"]}
+        if config["trocr_max_new_tokens"]:
+            options["max_new_tokens"] = config["trocr_max_new_tokens"]
+        return options
+    if name == "trocr-onnx":
+        return {
+            "model_name": config["model_name"],
+            "backend": config["trocr_backend"],
+            "max_new_tokens": config["trocr_max_new_tokens"],
+            "export_dir": os.path.join(config["cache_dir"], "onnx"),
+            "model_dir": config["model_dir"],
+        }
+    if name == "tesseract":
+        return {"micr_lang": config["micr_lang"]}
+    return {}
+
+
+def prepare_engines(config):
+    errors = []
+    engines = {}
+    load_timings = {} if config["profile"] else None
+    if not config["preview_only"]:
+        wanted = [name for name in TEXT_ENGINES if name in config["engines"]] + ["tesseract"]
+        for name in wanted:
+            try:
+                # Engines already in the registry cost nothing here; only the first load is measured.
+                with timed(load_timings, name):
+                    engines[name] = get_engine(name, **engine_options(name, config))
+            except Exception as exc:
+                errors.append(f"{name}: {exc}")
+    return {"engines": engines, "errors": errors, "load_timings": load_timings}
+
+
+def get_runtime_engines(runtime, config):
+    # Engines are resolved on first use, so a batch answered entirely from the cache never loads a model.
+    if runtime.get("engines") is None:
+        runtime.update(prepare_engines(config))
+        pooled = runtime.get("pooled", False)
+        runtime["torch_threads"] = configure_torch_threads(config, runtime["engines"], pooled=pooled)
+    return runtime["engines"]
+
+
+# Bump when geometry or recognition changes in a way that invalidates cached results.
+CACHE_VERSION = 3
+
+CACHE_CONFIG_KEYS = (
+    "regions",
+    "engines",
+    "model_name",
+    "micr_lang",
+    "origin",
+    "anchor",
+    "crop_max",
+    "include_previews",
+    "preview_format",
+    "preview_quality",
+    "preview_size",
+    "preview_page_size",
+    "align_enabled",
+    "bounds_padding",
+    "max_angle",
+    "angle_step",
+    "band_ratio",
+    "deskew_scale",
+    "work_scale",
+    "deskew_method",
+    "micr_min_confidence",
+    "cascade",
+    "cascade_threshold",
+    "amount_check",
+    "amount_alternatives",
+    "trocr_max_new_tokens",
+    "trocr_backend",
+    "layout_mode",
+    "multi_check",
+)
+
+PAGE_RECORD_KEYS = (
+    "width",
+    "height",
+    "candidates",
+    "confidences",
+    "previews",
+    "micrTopNorm",
+    "micrTopPx",
+    "micrBottomNorm",
+    "micrBox",
+    "micrConfidence",
+    "alignedPreview",
+    "amountCheck",
+    "layout",
+    "bounds",
+)
+
+
+class ResultCache:
+    # SQLite store of raw per-page results (geometry plus every engine's candidates), keyed by
+    # image bytes and effective config. Selection runs again on a hit, so it is not part of the key.
+
+    def __init__(self, directory, max_bytes):
+        import sqlite3
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "results.sqlite")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, record TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def config_digest(config):
+        subset = {name: config[name] for name in CACHE_CONFIG_KEYS}
+        subset["version"] = CACHE_VERSION
+        return hashlib.sha256(json.dumps(subset, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def key_for(self, image, config):
+        digest = hashlib.sha256()
+        if is_pdf_page(image):
+            digest.update(f"{image['digest']}:{image['page']}:{image['dpi']}".encode("utf-8"))
+        elif is_image_bytes(image):
+            digest.update(image)
+        else:
+            with open(image, "rb") as handle:
+                for chunk in iter(lambda: handle.read(1 << 20), b""):
+                    digest.update(chunk)
+        return f"{digest.hexdigest()}:{self.config_digest(config)}"
+
+    def get(self, key):
+        row = self.db.execute("SELECT record FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, record):
+        text = json.dumps(record)
+        self.db.execute(
+            "INSERT OR REPLACE INTO results (key, record, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, text, len(text), time.time()),
+        )
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM results ORDER BY last_used ASC").fetchall():
+            self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+_RESULT_CACHES = {}
+
+
+def get_result_cache(config):
+    # A profiled run measures the pipeline; a cached page would come back with empty timings.
+    if config["cache_mode"] in ("0", "off", "false") or config["preview_only"] or config["profile"]:
+        return None
+    cache = _RESULT_CACHES.get(config["cache_dir"])
+    if cache is None:
+        try:
+            cache = ResultCache(config["cache_dir"], int(config["cache_max_mb"] * 1024 * 1024))
+        except Exception:
+            return None
+        _RESULT_CACHES[config["cache_dir"]] = cache
+    return cache
+
+
+def lookup_cached_page(cache, image_path, config):
+    if cache is None:
+        return None, None
+    try:
+        key = cache.key_for(image_path, config)
+    except OSError:
+        return None, None
+    # "refresh" recomputes and overwrites; it never reads.
+    if config["cache_mode"] == "refresh":
+        cache.misses += 1
+        return key, None
+    record = cache.get(key)
+    if record is None:
+        return key, None
+    return key, page_from_record(record, config)
+
+
+def page_from_record(record, config):
+    if record.get("checks") is not None:
+        return {
+            "width": record["width"],
+            "height": record["height"],
+            "checks": [page_from_record(item, config) for item in record["checks"]],
+            "errors": [],
+            "cached": True,
+            "timings": new_timings(config),
+        }
+    page = {name: record.get(name) for name in PAGE_RECORD_KEYS}
+    # Encoded previews are kept as base64 text in the record.
+    if page["previews"] is not None:
+        page["previews"] = {name: base64.b64decode(data) for name, data in page["previews"].items()}
+    if page["alignedPreview"] is not None:
+        page["alignedPreview"] = base64.b64decode(page["alignedPreview"])
+    page.update({"crops": {}, "errors": [], "cached": True, "timings": new_timings(config)})
+    return page
+
+
+def page_record(page):
+    if page.get("checks") is not None:
+        return {
+            "width": page["width"],
+            "height": page["height"],
+            "checks": [page_record(item) for item in page["checks"]],
+        }
+    record = {name: page.get(name) for name in PAGE_RECORD_KEYS}
+    if record["previews"] is not None:
+        record["previews"] = {name: base64.b64encode(data).decode("ascii") for name, data in record["previews"].items()}
+    if record["alignedPreview"] is not None:
+        record["alignedPreview"] = base64.b64encode(record["alignedPreview"]).decode("ascii")
+    return record
+
+
+def page_checks(page):
+    # A segmented multi-check page carries its checks as sub-pages; any other page is its own check.
+    return page["checks"] if page.get("checks") is not None else [page]
+
+
+def store_cached_page(cache, page):
+    if cache is None or page.get("cached") or not page.get("cacheKey"):
+        return
+    if page["errors"] or any(check["errors"] for check in page_checks(page)):
+        return
+    import sqlite3
+
+    try:
+        cache.put(page["cacheKey"], page_record(page))
+    except sqlite3.Error:
+        pass
+
+
+def is_image_bytes(image):
+    return isinstance(image, (bytes, bytearray, memoryview))
+
+
+def is_pdf(image):
+    if is_image_bytes(image):
+        return bytes(image[:5]) == b"%PDF-"
+    return isinstance(image, str) and image.lower().endswith(".pdf")
+
+
+def is_pdf_page(image):
+    return isinstance(image, dict) and "pdf" in image
+
+
+def pdf_page_refs(pdf, dpi):
+    # One reference per page; pages are rendered later, by whichever process prepares them. PDF bytes are
+    # spooled to a temporary file first so a reference pickled to a preparation worker carries a path,
+    # not the whole document.
+    try:
+        import pypdfium2  # noqa: F401
+    except ImportError:
+        raise ImportError("pypdfium2 is required to read PDF input")
+    if is_image_bytes(pdf):
+        digest = hashlib.sha256(pdf).hexdigest()
+        with tempfile.NamedTemporaryFile(prefix="handwriting_ocr-", suffix=".pdf", delete=False) as handle:
+            handle.write(pdf)
+        path, name, spooled = handle.name, "document.pdf", True
+    else:
+        with open(pdf, "rb") as handle:
+            digest = hashlib.sha256(handle.read()).hexdigest()
+        path, name, spooled = pdf, os.path.basename(pdf), False
+    count = len(pdf_document(path, digest))
+    return [
+        {"pdf": path, "page": index, "dpi": dpi, "digest": digest, "name": name, "spooled": spooled}
+        for index in range(count)
+    ]
+
+
+_PDF_DOCUMENT = {}
+
+
+def pdf_document(path, digest):
+    # Pages of a PDF are prepared in order, so the batch process keeps the document it last opened.
+    import pypdfium2 as pdfium
+
+    if _PDF_DOCUMENT.get("key") != (path, digest):
+        close_pdf_document()
+        _PDF_DOCUMENT.update({"key": (path, digest), "document": pdfium.PdfDocument(path)})
+    return _PDF_DOCUMENT["document"]
+
+
+def close_pdf_document():
+    document = _PDF_DOCUMENT.pop("document", None)
+    _PDF_DOCUMENT.clear()
+    if document is not None:
+        document.close()
+
+
+def render_pdf_page(ref):
+    document = pdf_document(ref["pdf"], ref["digest"])
+    # Grayscale is all the pipeline uses, and a third of the memory of RGB at 300 dpi.
+    bitmap = document[ref["page"]].render(scale=ref["dpi"] / 72.0, grayscale=True)
+    return bitmap.to_pil().copy()
+
+
+def open_image(image):
+    # Accepts a path, the raw encoded bytes of an image, or a PDF page reference.
+    if is_pdf_page(image):
+        return render_pdf_page(image)
+    return Image.open(io.BytesIO(image) if is_image_bytes(image) else image)
+
+
+def image_source(image, index):
+    if is_pdf_page(image):
+        return f"{image['name']}#page={image['page'] + 1}"
+    return f"image-{index + 1}" if is_image_bytes(image) else os.path.basename(image)
+
+
+def encode_preview(image, size, image_format="png", quality=70):
+    preview = image.copy()
+    preview.thumbnail((size, size))
+    buffer = io.BytesIO()
+    if image_format == "png":
+        preview.save(buffer, format="PNG")
+    elif image_format == "webp":
+        preview.save(buffer, format="WEBP", quality=quality, method=0)
+    else:
+        preview.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def emit_preview(data, config, name):
+    # Inline previews travel as base64 in the JSON; file previews are written once and referenced by path.
+    if config["preview_mode"] != "file":
+        return base64.b64encode(data).decode("ascii")
+    directory = config["preview_dir"] or os.path.join(tempfile.gettempdir(), "handwriting_ocr_previews")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.{PREVIEW_EXTENSIONS[config['preview_format']]}")
+    with open(path, "wb") as handle:
+        handle.write(data)
+    return path
+
+
+def select_candidate(key, candidates):
+    chosen_engine = ""
+    chosen_text = ""
+    if key in ("micr", "checkNumber"):
+        best_digits = ""
+        for engine, text in candidates.items():
+            digits = "".join([ch for ch in text if ch.isdigit()])
+            if len(digits) > len(best_digits):
+                best_digits = digits
+                chosen_engine = engine
+                chosen_text = digits or text
+    elif key == "numericAmount":
+        for engine, text in candidates.items():
+            if any(ch.isdigit() for ch in text) and len(text) >= len(chosen_text):
+                chosen_text = text
+                chosen_engine = engine
+    else:
+        for engine, text in candidates.items():
+            if len(text) > len(chosen_text):
+                chosen_text = text
+                chosen_engine = engine
+    return chosen_engine, chosen_text
+
+
+AMOUNT_PATTERN = re.compile(r"^\$?(?:\d{1,3}(?:,\d{3})+|\d+)(?:[.,]\d{2})?$")
+
+LEGAL_AMOUNT_PATTERN = re.compile(
+    r"\b(?:one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|fifteen|twenty|"
+    r"thirty|forty|fifty|sixty|seventy|eighty|ninety|hundred|thousand)|\d{1,2}\s*/\s*100",
+    re.IGNORECASE,
+)
+
+
+def validate_region_text(key, text):
+    text = (text or "").strip()
+    if key == "numericAmount":
+        return bool(AMOUNT_PATTERN.match(re.sub(r"\s", "", text)))
+    if key == "legalAmount":
+        return bool(LEGAL_AMOUNT_PATTERN.search(text))
+    digits = re.sub(r"\D", "", text)
+    if key == "checkNumber":
+        return 3 <= len(digits) <= 6 and len(digits) * 2 >= len(re.sub(r"\s", "", text))
+    if key == "micr":
+        return len(digits) >= 9
+    return bool(text)
+
+
+def cascade_accepts(key, text, confidence, threshold):
+    # Engines without a score (tesseract CLI, older paddle) are judged on format alone.
+    return validate_region_text(key, text) and (confidence is None or confidence >= threshold)
+
+
+def cascade_order(config):
+    return [name for name in config["engines"] if name in TEXT_ENGINES]
+
+
+def select_cascade_candidate(key, candidates, confidences, order, threshold):
+    # First engine in cascade order that passed; otherwise the most confident valid candidate;
+    # otherwise the usual heuristics.
+    for name in order:
+        if name in candidates and cascade_accepts(key, candidates[name], confidences.get(name), threshold):
+            return name, candidates[name]
+    valid = [name for name in candidates if validate_region_text(key, candidates[name])]
+    if valid:
+        best = max(valid, key=lambda name: confidences.get(name) or 0.0)
+        return best, candidates[best]
+    return select_candidate(key, candidates)
+
+
+def generation_profile(config, key):
+    region = config["regions"].get(key) or {}
+    profile = {**DEFAULT_GENERATION_PROFILES.get(key, {}), **{name: region[name] for name in GENERATION_PROFILE_KEYS if name in region}}
+    return tuple(sorted((name, value) for name, value in profile.items() if value is not None)) or None
+
+
+def choose_region(page, key, config):
+    candidates = page["candidates"][key]
+    if config["cascade"]:
+        confidences = (page.get("confidences") or {}).get(key) or {}
+        return select_cascade_candidate(key, candidates, confidences, cascade_order(config), config["cascade_threshold"])
+    return select_candidate(key, candidates)
+
+
+LEGAL_NUMBER_WORDS = {
+    "zero": 0,
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+    "thirteen": 13,
+    "fourteen": 14,
+    "fifteen": 15,
+    "sixteen": 16,
+    "seventeen": 17,
+    "eighteen": 18,
+    "nineteen": 19,
+    "twenty": 20,
+    "thirty": 30,
+    "forty": 40,
+    "fifty": 50,
+    "sixty": 60,
+    "seventy": 70,
+    "eighty": 80,
+    "ninety": 90,
+}
+
+LEGAL_SCALE_WORDS = {"hundred": 100, "thousand": 1000, "million": 1000000}
+
+# Words written around the amount; they are skipped rather than corrected into the nearest number word.
+LEGAL_FILLER_WORDS = {"and", "only", "even", "exactly", "no", "cents", "cent", "pay", "the", "sum", "of", "xx"}
+
+# Common TrOCR misreads; kept in step with normalizeLegalToken in depositSlip.js.
+LEGAL_TOKEN_FIXES = {
+    "there": "three",
+    "tree": "three",
+    "thrce": "three",
+    "thre": "three",
+    "to": "two",
+    "too": "two",
+    "for": "four",
+    "fore": "four",
+    "ate": "eight",
+    "o": "one",
+    "ole": "one",
+    "won": "one",
+    "thousnd": "thousand",
+    "thousamd": "thousand",
+    "hund": "hundred",
+    "hunded": "hundred",
+    "hundrd": "hundred",
+    "cryly": "eighty",
+    "by": "and",
+}
+
+
+def edit_distance(left, right):
+    previous = list(range(len(right) + 1))
+    for i, left_char in enumerate(left, 1):
+        current = [i]
+        for j, right_char in enumerate(right, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (left_char != right_char)))
+        previous = current
+    return previous[-1]
+
+
+def correct_legal_token(token):
+    token = LEGAL_TOKEN_FIXES.get(token, token)
+    if not token or re.search(r"[\d/]", token) or token in LEGAL_FILLER_WORDS:
+        return token
+    if token in LEGAL_NUMBER_WORDS or token in LEGAL_SCALE_WORDS:
+        return token
+    words = list(LEGAL_NUMBER_WORDS) + list(LEGAL_SCALE_WORDS)
+    best = min(words, key=lambda word: edit_distance(token, word))
+    return best if edit_distance(token, best) <= (2 if len(token) >= 6 else 1) else token
+
+
+def parse_legal_amount(text):
+    text = re.sub(r"\bdollars?\b", " ", (text or "").lower())
+    tokens = [correct_legal_token(token) for token in re.sub(r"[^a-z0-9/ ]", " ", text).split()]
+    total = 0
+    current = 0
+    cents = None
+    seen = False
+    for token in tokens:
+        match = re.fullmatch(r"(\d{1,2})/100", token)
+        if match:
+            cents = int(match.group(1))
+        elif token == "hundred":
+            current = (current or 1) * 100
+            seen = True
+        elif token in LEGAL_SCALE_WORDS:
+            total += (current or 1) * LEGAL_SCALE_WORDS[token]
+            current = 0
+            seen = True
+        elif token in LEGAL_NUMBER_WORDS:
+            current += LEGAL_NUMBER_WORDS[token]
+            seen = True
+    if not seen:
+        return None
+    return round(total + current + (cents or 0) / 100.0, 2)
+
+
+def parse_numeric_amount(text):
+    cleaned = (text or "").translate(str.maketrans("OoIl|SsZzBb", "00111552288"))
+    match = re.search(r"\d[\d.,]*", cleaned)
+    if not match:
+        return None
+    # The last separator is the decimal point when one or two digits follow it (12.5, 1.234,56); any
+    # other separator groups thousands (1,234 or 1.234).
+    number = match.group(0).rstrip(".,")
+    split = max(number.rfind("."), number.rfind(","))
+    whole, cents = (number[:split], number[split + 1 :]) if split >= 0 and len(number) - split <= 3 else (number, "")
+    return round(float(f"{re.sub(r'[.,]', '', whole) or 0}.{cents or 0}"), 2)
+
+
+def find_amount_pair(numeric_options, legal_options):
+    # Options are (engine, text) in preference order; the first jointly consistent pair wins.
+    legal_values = [(option, parse_legal_amount(option[1])) for option in legal_options]
+    for numeric in numeric_options:
+        value = parse_numeric_amount(numeric[1])
+        if value is None:
+            continue
+        for legal, legal_value in legal_values:
+            if legal_value is not None and abs(value - legal_value) < 0.005:
+                return numeric, legal, value
+    return None
+
+
+LAYOUT_CONFIG_KEYS = ("regions", "origin", "anchor", "align_enabled", "bounds_padding", "max_angle", "deskew_method")
+
+# Positions stored as a fraction of page height below the anchor; the rest are fractions of page width.
+LAYOUT_Y_FIELDS = ("underline",)
+
+
+def layout_signature(gray, bins=48, threshold=0.2):
+    # Long printed rules (borders, the legal-amount line, box edges) as peak positions along each axis.
+    # Handwriting rarely darkens a fifth of a full row or column, so checks from one layout agree.
+    ink = gray < 128
+
+    def peaks(density):
+        buckets = np.unique(np.flatnonzero(density > threshold) * bins // max(1, density.size))
+        if buckets.size == 0:
+            return []
+        runs = np.split(buckets, np.flatnonzero(np.diff(buckets) > 1) + 1)
+        return [round(float(run.mean()), 1) for run in runs]
+
+    return {
+        "rows": peaks(ink.mean(axis=1)),
+        "cols": peaks(ink.mean(axis=0)),
+        "aspect": round(gray.shape[1] / float(max(1, gray.shape[0])), 3),
+    }
+
+
+def signatures_match(left, right, tolerance=1.5, aspect_tolerance=0.05):
+    if abs(left["aspect"] - right["aspect"]) > aspect_tolerance * right["aspect"]:
+        return False
+    for axis in ("rows", "cols"):
+        if len(left[axis]) != len(right[axis]):
+            return False
+        if any(abs(a - b) > tolerance for a, b in zip(left[axis], right[axis])):
+            return False
+    return True
 
-    align_enabled = os.environ.get("OCR_ALIGN") == "1"
-    bounds_padding = int(os.environ.get("OCR_BOUNDS_PADDING") or 0)
-    max_angle = float(os.environ.get("OCR_DESKEW_MAX_ANGLE") or 3)
-    angle_step = float(os.environ.get("OCR_DESKEW_STEP") or 0.5)
-    band_ratio = float(os.environ.get("OCR_DESKEW_BAND") or 0.2)
-    deskew_scale = float(os.environ.get("OCR_DESKEW_SCALE") or 0.4)
 
-    with Image.open(image_path) as image:
-        image = preprocess(image)
-        image = align_check(image, align_enabled, bounds_padding, max_angle, angle_step, band_ratio, deskew_scale)
+def layout_to_px(geometry, width, height, ref_y):
+    return {
+        key: {
+            name: None
+            if value is None
+            else int(round(ref_y + value * height)) if name in LAYOUT_Y_FIELDS else int(round(value * width))
+            for name, value in fields.items()
+        }
+        for key, fields in geometry.items()
+    }
+
+
+def layout_from_px(structures, width, height, ref_y):
+    return {
+        key: {
+            name: None
+            if value is None
+            else round((value - ref_y) / float(height), 5) if name in LAYOUT_Y_FIELDS else round(value / float(width), 5)
+            for name, value in fields.items()
+        }
+        for key, fields in structures.items()
+        if fields is not None
+    }
+
+
+def layout_config_key(config):
+    subset = {name: config[name] for name in LAYOUT_CONFIG_KEYS}
+    return hashlib.sha256(json.dumps(subset, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class LayoutStore:
+    # SQLite store of solved check layouts: a page's layout_signature and the printed structure the
+    # refine_*_crop searches found on it. Later pages with a matching signature replay the structure.
+
+    def __init__(self, directory, config_key):
+        import sqlite3
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "layouts.sqlite")
+        self.config_key = config_key
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS layouts ("
+            "id TEXT PRIMARY KEY, config TEXT NOT NULL, anchor TEXT NOT NULL, signature TEXT NOT NULL, "
+            "geometry TEXT NOT NULL, routing TEXT, hits INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    def match(self, signature, anchor):
+        rows = self.db.execute(
+            "SELECT id, signature, geometry, routing FROM layouts WHERE config = ? AND anchor = ? ORDER BY hits DESC",
+            (self.config_key, anchor),
+        ).fetchall()
+        for layout_id, stored, geometry, routing in rows:
+            if signatures_match(signature, json.loads(stored)):
+                self.db.execute(
+                    "UPDATE layouts SET hits = hits + 1, last_used = ? WHERE id = ?", (time.time(), layout_id)
+                )
+                self.db.commit()
+                return {"id": layout_id, "geometry": json.loads(geometry), "routing": routing}
+        return None
+
+    def learn(self, signature, anchor, geometry):
+        text = json.dumps(signature, sort_keys=True)
+        layout_id = hashlib.sha256(f"{self.config_key}:{anchor}:{text}".encode("utf-8")).hexdigest()[:12]
+        self.db.execute(
+            "INSERT OR IGNORE INTO layouts (id, config, anchor, signature, geometry, routing, hits, last_used) "
+            "VALUES (?, ?, ?, ?, ?, NULL, 0, ?)",
+            (layout_id, self.config_key, anchor, text, json.dumps(geometry), time.time()),
+        )
+        self.db.commit()
+        return layout_id
+
+    def relearn(self, layout_id, geometry):
+        self.db.execute(
+            "UPDATE layouts SET geometry = ?, last_used = ? WHERE id = ?",
+            (json.dumps(geometry), time.time(), layout_id),
+        )
+        self.db.commit()
+
+    def set_routing(self, layout_id, routing):
+        self.db.execute("UPDATE layouts SET routing = ? WHERE id = ? AND routing IS NULL", (routing, layout_id))
+        self.db.commit()
+
+
+_LAYOUT_STORES = {}
+
+
+def get_layout_store(config):
+    if config["layout_mode"] in ("0", "off", "false") or config["preview_only"]:
+        return None
+    key = (config["cache_dir"], layout_config_key(config))
+    store = _LAYOUT_STORES.get(key)
+    if store is None:
+        try:
+            store = LayoutStore(*key)
+        except Exception:
+            return None
+        _LAYOUT_STORES[key] = store
+    return store
+
+
+def is_aba_routing(digits):
+    weights = (3, 7, 1) * 3
+    return len(digits) == 9 and sum(int(digit) * weight for digit, weight in zip(digits, weights)) % 10 == 0
+
+
+def micr_routing(text):
+    # Same clean-up as normalizeMicrDigits in depositSlip.js, then the first checksum-valid 9-digit run.
+    digits = re.sub(r"\D", "", (text or "").translate(str.maketrans("OoIl|SsZzBb", "00111552288")))
+    for start in range(0, len(digits) - 8):
+        if is_aba_routing(digits[start : start + 9]):
+            return digits[start : start + 9]
+    return None
+
+
+def prepare_page(image_path, config):
+    timings = new_timings(config)
+    with timed(timings, "stages", "decode"):
+        image = open_image(image_path)
+        image.load()
+    with image:
+        rects = []
+        if config["multi_check"] and not config["preview_only"]:
+            with timed(timings, "stages", "segment"):
+                rects = find_check_rects(np.asarray(image if image.mode == "L" else image.convert("L")))
+        if not rects:
+            return prepare_check(image, config, timings)
+        # Each check runs the single-check pipeline on its own sub-image, so regions, alignment and MICR
+        # anchoring stay relative to that check rather than the sheet.
+        checks = []
+        for rect in rects:
+            with image.crop(rect) as check_image:
+                check = prepare_check(check_image, config, new_timings(config))
+            check["bounds"] = dict(zip(("left", "top", "right", "bottom"), (int(value) for value in rect)))
+            checks.append(check)
         width, height = image.size
-        gray = np.array(image.convert("L"))
+    return {
+        "width": width,
+        "height": height,
+        "checks": checks,
+        "errors": [],
+        "timings": timings,
+    }
 
+
+def locate_regions(gray, config, timings=None):
+    # Region rectangles for an aligned page, moved onto the MICR band when OCR_REGION_ANCHOR=micr.
+    regions = dict(config["regions"])
+    origin = config["origin"]
+    anchor = config["anchor"]
+    height, width = gray.shape
+    with timed(timings, "stages", "micr"):
         micr_bounds = detect_micr_band(gray) if anchor == "micr" else None
-        micr_top_norm = None
-        micr_bottom_norm = None
-        micr_top_px = None
-        micr_box = None
-        if micr_bounds:
-            micr_top, micr_bottom = micr_bounds
+    micr_top_norm = None
+    micr_bottom_norm = None
+    micr_top_px = None
+    micr_box = None
+    micr_confidence = micr_bounds[2] if micr_bounds else None
+    if micr_bounds and micr_confidence < config["micr_min_confidence"]:
+        micr_bounds = None
+    if micr_bounds:
+        micr_top, micr_bottom, _ = micr_bounds
+        with timed(timings, "stages", "micr"):
             micr_top, micr_bottom, micr_left, micr_right = tighten_micr_bounds(gray, micr_top, micr_bottom)
-            micr_top_px = micr_top
-            micr_box = {
-                "top": int(micr_top),
-                "bottom": int(micr_bottom),
-                "left": int(micr_left),
-                "right": int(micr_right),
-            }
-            if origin == "bottom-left":
-                micr_top_norm = 1.0 - (micr_top / float(height))
-                micr_bottom_norm = 1.0 - (micr_bottom / float(height))
-                if micr_top_norm < micr_bottom_norm:
-                    micr_top_norm, micr_bottom_norm = micr_bottom_norm, micr_top_norm
-            else:
-                micr_top_norm = micr_top / float(height)
-                micr_bottom_norm = micr_bottom / float(height)
-            regions["micr"] = set_region_box_from_px(
-                regions.get("micr", {}),
-                micr_left,
-                micr_right,
-                micr_top,
-                micr_bottom,
-                width,
-                height,
-                origin,
-            )
+        micr_top_px = micr_top
+        micr_box = {
+            "top": int(micr_top),
+            "bottom": int(micr_bottom),
+            "left": int(micr_left),
+            "right": int(micr_right),
+        }
+        if origin == "bottom-left":
+            micr_top_norm = 1.0 - (micr_top / float(height))
+            micr_bottom_norm = 1.0 - (micr_bottom / float(height))
+            if micr_top_norm < micr_bottom_norm:
+                micr_top_norm, micr_bottom_norm = micr_bottom_norm, micr_top_norm
+        else:
+            micr_top_norm = micr_top / float(height)
+            micr_bottom_norm = micr_bottom / float(height)
+        regions["micr"] = set_region_box_from_px(
+            regions.get("micr", {}),
+            micr_left,
+            micr_right,
+            micr_top,
+            micr_bottom,
+            width,
+            height,
+            origin,
+        )
 
-        if anchor == "micr" and micr_top_px is not None:
-            legal_top_px = micr_top_px - (0.34 * height)
-            legal_bottom_px = legal_top_px + (0.11 * height)
-            numeric_top_px = micr_top_px - (0.37 * height)
-            numeric_bottom_px = numeric_top_px + (0.12 * height)
-            regions["legalAmount"] = set_region_y_from_px(
-                regions.get("legalAmount", {}),
-                legal_top_px,
-                legal_bottom_px,
-                height,
-                origin,
-            )
-            regions["numericAmount"] = set_region_y_from_px(
-                regions.get("numericAmount", {}),
-                numeric_top_px,
-                numeric_bottom_px,
-                height,
-                origin,
-            )
-            regions["checkNumber"] = set_region_box_from_px(
-                regions.get("checkNumber", {}),
-                micr_box["left"] if micr_box else 0,
-                micr_box["right"] if micr_box else width,
-                micr_box["top"] if micr_box else micr_top_px,
-                micr_box["bottom"] if micr_box else micr_top_px,
-                width,
-                height,
-                origin,
-            )
+    if anchor == "micr" and micr_top_px is not None:
+        legal_top_px = micr_top_px - (0.34 * height)
+        legal_bottom_px = legal_top_px + (0.11 * height)
+        numeric_top_px = micr_top_px - (0.37 * height)
+        numeric_bottom_px = numeric_top_px + (0.12 * height)
+        regions["legalAmount"] = set_region_y_from_px(
+            regions.get("legalAmount", {}),
+            legal_top_px,
+            legal_bottom_px,
+            height,
+            origin,
+        )
+        regions["numericAmount"] = set_region_y_from_px(
+            regions.get("numericAmount", {}),
+            numeric_top_px,
+            numeric_bottom_px,
+            height,
+            origin,
+        )
+        regions["checkNumber"] = set_region_box_from_px(
+            regions.get("checkNumber", {}),
+            micr_box["left"] if micr_box else 0,
+            micr_box["right"] if micr_box else width,
+            micr_box["top"] if micr_box else micr_top_px,
+            micr_box["bottom"] if micr_box else micr_top_px,
+            width,
+            height,
+            origin,
+        )
 
-        trocr_processor = None
-        trocr_model = None
-        if "trocr" in engines and not preview_only:
-            try:
-                trocr_processor, trocr_model = load_trocr(model_name)
-            except Exception as exc:
-                trocr_processor, trocr_model = None, None
-                errors.append(f"trocr: {exc}")
+    return {
+        "regions": regions,
+        "micrTopNorm": micr_top_norm,
+        "micrBottomNorm": micr_bottom_norm,
+        "micrTopPx": micr_top_px,
+        "micrBox": micr_box,
+        "micrConfidence": micr_confidence,
+    }
 
-        paddle_available = "paddle" in engines and not preview_only and can_use_paddle(errors)
 
-        region_results = {}
-        for key, region in regions.items():
-            crop = crop_region(image, region)
+def prepare_check(image, config, timings):
+    origin = config["origin"]
+    crop_max = config["crop_max"]
+    preview_only = config["preview_only"]
+
+    align_enabled = config["align_enabled"]
+    bounds_padding = config["bounds_padding"]
+    max_angle = config["max_angle"]
+    angle_step = config["angle_step"]
+    band_ratio = config["band_ratio"]
+    deskew_scale = config["deskew_scale"]
+    deskew_method = config["deskew_method"]
+    work_scale = config["work_scale"]
+
+    # With OCR_WORK_SCALE < 1, enhancement, alignment, MICR detection and region placement all run on
+    # a decimated copy; only the final region rectangles are cut from the full-resolution source and
+    # enhanced on their own.
+    source = None
+    factor = 1.0
+    if work_scale < 1:
+        with timed(timings, "stages", "downscale"):
+            source = image if image.mode == "L" else image.convert("L")
+            image = source.resize(
+                (max(1, round(source.width * work_scale)), max(1, round(source.height * work_scale))),
+                resample=Image.BOX,
+            )
+            factor = source.width / float(image.width)
+            deskew_scale = min(1.0, deskew_scale * factor)
+    with timed(timings, "stages", "preprocess"):
+        # The page stays single-channel through geometry and cropping; recognizers expand crops to
+        # RGB themselves.
+        gray = preprocess_gray(np.asarray(image if image.mode == "L" else image.convert("L")))
+        image = Image.fromarray(gray)
+    with timed(timings, "stages", "align"):
+        image, gray, alignment = align_check(
+            image,
+            align_enabled,
+            bounds_padding,
+            max_angle,
+            angle_step,
+            band_ratio,
+            deskew_scale,
+            gray=gray,
+            method=deskew_method,
+        )
+    width, height = image.size
+    analysis = PageAnalysis(gray)
+
+    located = locate_regions(gray, config, timings)
+    regions = located["regions"]
+    micr_top_norm = located["micrTopNorm"]
+    micr_bottom_norm = located["micrBottomNorm"]
+    micr_top_px = located["micrTopPx"]
+    micr_box = located["micrBox"]
+    micr_confidence = located["micrConfidence"]
+
+    # A known layout replays the printed structure (legal underline, right block, numeric box edge)
+    # instead of searching for it; a new one is learned from this page's searches.
+    layouts = get_layout_store(config)
+    layout = None
+    structures = {}
+    layout_anchor = "micr" if micr_top_px is not None else "page"
+    ref_y = micr_top_px if micr_top_px is not None else 0
+    if layouts is not None:
+        with timed(timings, "stages", "layout"):
+            signature = layout_signature(gray)
+            try:
+                layout = layouts.match(signature, layout_anchor)
+            except Exception:
+                layout = None
+        if layout is not None:
+            structures = layout_to_px(layout["geometry"], width, height, ref_y)
+
+    crops = {}
+    crop_boxes = {}
+    solved = {}
+    stale = False
+    for key, region in regions.items():
+        with timed(timings, "regions", key, "crop"):
+            view = analysis.crop(*region_box(region, width, height, origin))
             if not preview_only:
                 if key in ("numericAmount", "legalAmount", "checkNumber"):
-                    crop = tighten_to_ink(crop)
+                    view = tighten_to_ink(view)
                 if key == "numericAmount":
-                    crop = refine_numeric_crop(crop)
+                    view, solved[key], missed = replay_or_refine(refine_numeric_crop, view, structures.get(key))
+                    stale = stale or missed
                 if key == "legalAmount":
-                    crop = refine_legal_crop(crop)
+                    view, solved[key], missed = replay_or_refine(refine_legal_crop, view, structures.get(key))
+                    stale = stale or missed
+            if source is None:
+                crop = image.crop(view.box)
+            else:
+                crop = preprocess(cut_aligned_region(source, alignment, view.box, factor))
             if crop_max:
                 crop.thumbnail((crop_max, crop_max))
-            candidates = {}
-
-            if key != "micr":
-                if "trocr" in engines and trocr_processor and trocr_model:
-                    candidates["trocr"] = trocr_ocr(crop, trocr_processor, trocr_model)
-
-                if "paddle" in engines and paddle_available:
-                    try:
-                        candidates["paddle"] = paddle_ocr(crop)
-                    except Exception as exc:
-                        errors.append(f"paddle: {exc}")
-            if key == "micr" and not preview_only:
-                candidates["tesseract"] = micr_ocr_tesseract(crop)
-
-            chosen_engine = ""
-            chosen_text = ""
-            if key == "micr":
-                best_digits = ""
-                for engine, text in candidates.items():
-                    digits = "".join([ch for ch in text if ch.isdigit()])
-                    if len(digits) > len(best_digits):
-                        best_digits = digits
-                        chosen_engine = engine
-                        chosen_text = digits or text
-            elif key == "checkNumber":
-                best_digits = ""
-                for engine, text in candidates.items():
-                    digits = "".join([ch for ch in text if ch.isdigit()])
-                    if len(digits) > len(best_digits):
-                        best_digits = digits
-                        chosen_engine = engine
-                        chosen_text = digits or text
-            elif key == "numericAmount":
-                for engine, text in candidates.items():
-                    if any(ch.isdigit() for ch in text) and len(text) >= len(chosen_text):
-                        chosen_text = text
-                        chosen_engine = engine
-            else:
-                for engine, text in candidates.items():
-                    if len(text) > len(chosen_text):
-                        chosen_text = text
-                        chosen_engine = engine
-
-            region_results[key] = {
-                "text": chosen_text.strip(),
-                "engine": chosen_engine,
-                "candidates": candidates,
-            }
-            if include_previews:
-                preview = crop.copy()
-                preview.thumbnail((600, 600))
-                buffer = io.BytesIO()
-                preview.save(buffer, format="PNG")
-                region_results[key]["previewBase64"] = base64.b64encode(buffer.getvalue()).decode("ascii")
+            crops[key] = crop
+            crop_boxes[key] = view.box
+
+    page_layout = None
+    if layouts is not None:
+        page_layout = {"id": layout["id"] if layout else None, "hit": layout is not None}
+        # Only a page where every search found its structure is worth replaying; a stale replay is
+        # overwritten with what this page's searches found.
+        complete = bool(solved) and all(
+            fields is not None and None not in fields.values() for fields in solved.values()
+        )
+        if (layout is None or stale) and complete and config["layout_mode"] != "read":
+            with timed(timings, "stages", "layout"):
+                try:
+                    geometry = layout_from_px(solved, width, height, ref_y)
+                    if layout is None:
+                        page_layout["id"] = layouts.learn(signature, layout_anchor, geometry)
+                    else:
+                        layouts.relearn(layout["id"], geometry)
+                except Exception:
+                    pass
+
+    with timed(timings, "stages", "previews"):
+        aligned_preview = None
+        if config["include_previews"]:
+            aligned_preview = encode_preview(
+                image, config["preview_page_size"], config["preview_format"], config["preview_quality"]
+            )
 
-    payload = {
+    if source is not None:
+        # Pixel outputs are reported in source-resolution coordinates.
+        width, height = int(round(width * factor)), int(round(height * factor))
+        if micr_top_px is not None:
+            micr_top_px = int(round(micr_top_px * factor))
+        if micr_box is not None:
+            micr_box = {key: int(round(value * factor)) for key, value in micr_box.items()}
+        crop_boxes = {key: tuple(int(round(value * factor)) for value in box) for key, box in crop_boxes.items()}
+
+    return {
         "width": width,
         "height": height,
-        "lines": [],
-        "regions": region_results,
-        "engines": engines,
-        "errors": errors,
+        "crops": crops,
+        # Where each crop was cut on the aligned page, and the alignment that produced that page.
+        "cropBoxes": crop_boxes,
+        "alignment": alignment,
+        "candidates": {key: {} for key in crops},
+        "confidences": {key: {} for key in crops},
+        "errors": [],
         "micrTopNorm": micr_top_norm,
         "micrTopPx": micr_top_px,
         "micrBottomNorm": micr_bottom_norm,
         "micrBox": micr_box,
-        "previewOnly": preview_only,
+        "micrConfidence": micr_confidence,
+        "alignedPreview": aligned_preview,
+        "layout": page_layout,
+        "timings": timings,
+        "preparePeakRssMb": peak_rss_mb() if timings is not None else None,
     }
-    if include_previews:
-        preview = image.copy()
-        preview.thumbnail((800, 800))
-        buffer = io.BytesIO()
-        preview.save(buffer, format="PNG")
-        payload["alignedPreviewBase64"] = base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def recognize_pages(pages, config, runtime):
+    # The checks of a multi-check page are recognized alongside every other page's, in the same batches.
+    pages = [check for page in pages for check in page_checks(page) if not check.get("cached")]
+    if not pages:
+        return
+    engines = get_runtime_engines(runtime, config)
+    for page in pages:
+        page["errors"][:0] = runtime["errors"]
+    # Model load is charged once, to the first page that needed the engines.
+    load_timings = runtime.pop("load_timings", None)
+    if load_timings and pages[0].get("timings") is not None:
+        pages[0]["timings"]["modelLoad"] = load_timings
+
+    cascade = config["cascade"]
+    if cascade:
+        # Cascade: engines run in OCR_ENGINES order (cheapest first); a region leaves the cascade as soon
+        # as one engine's text validates with enough confidence.
+        text_order = [name for name in cascade_order(config) if name in engines]
+    else:
+        text_order = [name for name in TEXT_ENGINES if name in engines]
+
+    pending = [(page, key) for page in pages for key in page["crops"] if key != "micr"]
+    for name in text_order:
+        if not pending:
+            break
+        # Each engine sees every pending crop at once so it can batch across regions and pages.
+        if not run_engine_jobs(name, engines[name], pending, config, scores=cascade) or not cascade:
+            continue
+        threshold = config["cascade_threshold"]
+        pending = [
+            (page, key)
+            for page, key in pending
+            if not cascade_accepts(key, page["candidates"][key].get(name), page["confidences"][key].get(name), threshold)
+        ]
+    if "tesseract" in engines:
+        micr_jobs = [(page, key) for page in pages for key in page["crops"] if key == "micr"]
+        if micr_jobs:
+            run_engine_jobs("tesseract", engines["tesseract"], micr_jobs, config, scores=cascade)
+    if config["amount_check"] and any(name in engines for name in TEXT_ENGINES):
+        reconcile_amounts([page for page in pages if all(key in page["crops"] for key in AMOUNT_KEYS)], engines, config)
+
+
+AMOUNT_KEYS = ("numericAmount", "legalAmount")
+
+
+def amount_options(page, key, config):
+    chosen = choose_region(page, key, config)
+    return [chosen] + [(name, text) for name, text in page["candidates"][key].items() if (name, text) != chosen]
+
+
+def amount_retry_order(page, options):
+    # Re-read the region that failed to parse first; when both parse but disagree, the less confident one.
+    numeric_value = parse_numeric_amount(options["numericAmount"][0][1])
+    legal_value = parse_legal_amount(options["legalAmount"][0][1])
+    if numeric_value is None and legal_value is not None:
+        return ["numericAmount", "legalAmount"]
+    if legal_value is None and numeric_value is not None:
+        return ["legalAmount", "numericAmount"]
+    confidence = {
+        key: ((page.get("confidences") or {}).get(key) or {}).get(options[key][0][0]) or 0.0 for key in AMOUNT_KEYS
+    }
+    return sorted(AMOUNT_KEYS, key=lambda key: confidence[key])
+
+
+def add_region_alternatives(jobs, engines, config):
+    # jobs are (page, key, found) across pages; every engine re-reads all of its crops in one batch.
+    for name in TEXT_ENGINES:
+        engine = engines.get(name)
+        if engine is None:
+            continue
+        # The cascade stopped before this engine on these regions; its reading is a real candidate.
+        skipped = [(page, key, found) for page, key, found in jobs if name not in page["candidates"][key]]
+        skipped_jobs = [(page, key) for page, key, _ in skipped]
+        if skipped and run_engine_jobs(name, engine, skipped_jobs, config, scores=config["cascade"]):
+            for page, key, found in skipped:
+                found.append((name, page["candidates"][key][name], page["confidences"][key][name]))
+        if not hasattr(engine, "alternatives"):
+            continue
+        try:
+            alternatives = engine.alternatives(
+                [page["crops"][key] for page, key, _ in jobs],
+                config["amount_alternatives"],
+                [generation_profile(config, key) for _, key, _ in jobs],
+                batch_size=config["trocr_batch_size"],
+            )
+        except Exception as exc:
+            for page in {id(page): page for page, _, _ in jobs}.values():
+                page["errors"].append(f"{name}: {exc}")
+            continue
+        for (_, _, found), options in zip(jobs, alternatives):
+            found.extend((name, text, confidence) for text, confidence in options)
+
+
+def reconcile_amounts(pages, engines, config):
+    states = []
+    for page in pages:
+        options = {key: amount_options(page, key, config) for key in AMOUNT_KEYS}
+        pair = find_amount_pair(options["numericAmount"], options["legalAmount"])
+        order = amount_retry_order(page, options) if pair is None else []
+        states.append({"page": page, "options": options, "pair": pair, "order": order, "retried": [], "scores": {}})
+    # Each round re-reads one region of every still-inconsistent page: first the likelier culprit, then the other.
+    for step in range(len(AMOUNT_KEYS)):
+        pending = [state for state in states if state["pair"] is None]
+        if not pending:
+            break
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        jobs = [(state["page"], state["order"][step], []) for state in pending]
+        add_region_alternatives(jobs, engines, config)
+        wall = (time.perf_counter() - wall) / len(jobs)
+        cpu = (time.process_time() - cpu) / len(jobs)
+        for state, (page, key, found) in zip(pending, jobs):
+            state["retried"].append(key)
+            options = state["options"][key]
+            for name, text, confidence in found:
+                state["scores"].setdefault((key, name, text), confidence)
+                if (name, text) not in options:
+                    options.append((name, text))
+            state["pair"] = find_amount_pair(state["options"]["numericAmount"], state["options"]["legalAmount"])
+            if page.get("timings") is not None:
+                add_timing(page["timings"], ("stages", "amountCheck"), wall, cpu)
+    for state in states:
+        page, options, pair = state["page"], state["options"], state["pair"]
+        check = {
+            "match": pair is not None,
+            "numericValue": parse_numeric_amount(options["numericAmount"][0][1]),
+            "legalValue": parse_legal_amount(options["legalAmount"][0][1]),
+            "retried": state["retried"],
+        }
+        if pair is not None:
+            numeric, legal, value = pair
+            check.update({"value": value, "numericValue": value, "legalValue": value})
+            for key, (name, text) in (("numericAmount", numeric), ("legalAmount", legal)):
+                # A re-read carries its own score; a first-pass candidate keeps the one recorded for it.
+                confidence = state["scores"].get((key, name, text))
+                if confidence is None and page["candidates"][key].get(name) == text:
+                    confidence = page["confidences"][key].get(name)
+                check[key] = [name, text, confidence]
+        page["amountCheck"] = check
+
+
+def run_engine_jobs(name, engine, jobs, config, scores=False):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        results = engine.recognize(
+            [page["crops"][key] for page, key in jobs],
+            batch_size=config["trocr_batch_size"],
+            scores=scores,
+            profiles=[generation_profile(config, key) for _, key in jobs],
+        )
+    except Exception as exc:
+        for page in {id(page): page for page, _ in jobs}.values():
+            page["errors"].append(f"{name}: {exc}")
+        return False
+    # A batch mixes crops from several regions and pages, so its cost is split evenly per crop.
+    wall = (time.perf_counter() - wall) / len(jobs)
+    cpu = (time.process_time() - cpu) / len(jobs)
+    for (page, key), (text, confidence) in zip(jobs, results):
+        page["candidates"][key][name] = text
+        page["confidences"][key][name] = confidence
+        if page.get("timings") is not None:
+            add_timing(page["timings"], ("regions", key, name), wall, cpu)
+            add_timing(page["timings"], ("inference", name), wall, cpu)
+    return True
+
+
+def finish_sheet(sheet, config, cache=None):
+    checks = []
+    for index, page in enumerate(sheet["checks"]):
+        payload = finish_page(page, config)
+        payload.update({"index": index, "bounds": page["bounds"]})
+        checks.append(payload)
+    payload = {
+        "width": sheet["width"],
+        "height": sheet["height"],
+        "lines": [],
+        "checks": checks,
+        "engines": config["engines"],
+        "errors": sheet["errors"],
+    }
+    if sheet.get("timings") is not None:
+        payload["timings"] = round_timings(sheet["timings"])
+    if cache is not None:
+        store_cached_page(cache, sheet)
+        payload["cache"] = {"hit": bool(sheet.get("cached")), "hits": cache.hits, "misses": cache.misses}
     return payload
 
 
+def finish_page(page, config, cache=None):
+    if page.get("checks") is not None:
+        return finish_sheet(page, config, cache)
+    if config["include_previews"] and page.get("previews") is None:
+        page["previews"] = {
+            key: encode_preview(crop, config["preview_size"], config["preview_format"], config["preview_quality"])
+            for key, crop in page["crops"].items()
+        }
+    file_previews = config["preview_mode"] == "file"
+    preview_field = "previewPath" if file_previews else "previewBase64"
+    preview_token = uuid.uuid4().hex[:12]
+    region_results = {}
+    order = cascade_order(config)
+    amount_check = page.get("amountCheck")
+    for key, candidates in page["candidates"].items():
+        confidences = (page.get("confidences") or {}).get(key) or {}
+        if amount_check and amount_check.get(key):
+            # The jointly consistent numeric/legal pair overrides the per-region choice, with its own score.
+            chosen_engine, chosen_text, confidence = amount_check[key]
+        else:
+            chosen_engine, chosen_text = choose_region(page, key, config)
+            confidence = confidences.get(chosen_engine)
+        region_results[key] = {
+            "text": chosen_text.strip(),
+            "engine": chosen_engine,
+            "candidates": candidates,
+            "confidence": confidence,
+            "valid": validate_region_text(key, chosen_text),
+        }
+        if config["cascade"]:
+            region_results[key]["cascadeStep"] = order.index(chosen_engine) + 1 if chosen_engine in order else None
+        if config["include_previews"] and key in (page.get("previews") or {}):
+            region_results[key][preview_field] = emit_preview(page["previews"][key], config, f"{preview_token}-{key}")
+
+    payload = {
+        "width": page["width"],
+        "height": page["height"],
+        "lines": [],
+        "regions": region_results,
+        "engines": config["engines"],
+        "errors": page["errors"],
+        "micrTopNorm": page["micrTopNorm"],
+        "micrTopPx": page["micrTopPx"],
+        "micrBottomNorm": page["micrBottomNorm"],
+        "micrBox": page["micrBox"],
+        "micrConfidence": page["micrConfidence"],
+        "previewOnly": config["preview_only"],
+    }
+    if page["alignedPreview"] is not None:
+        aligned_field = "alignedPreviewPath" if file_previews else "alignedPreviewBase64"
+        payload[aligned_field] = emit_preview(page["alignedPreview"], config, f"{preview_token}-aligned")
+    if amount_check:
+        payload["amountCheck"] = {key: value for key, value in amount_check.items() if key not in AMOUNT_KEYS}
+    if page.get("layout"):
+        routing = micr_routing((region_results.get("micr") or {}).get("text"))
+        payload["layout"] = {**page["layout"], "routing": routing}
+        layouts = get_layout_store(config)
+        if routing and page["layout"]["id"] and layouts is not None and not page.get("cached"):
+            try:
+                layouts.set_routing(page["layout"]["id"], routing)
+            except Exception:
+                pass
+    if config["include_previews"]:
+        payload["previewFormat"] = config["preview_format"]
+    if page.get("timings") is not None:
+        timings = page["timings"]
+        payload["timings"] = round_timings(
+            {
+                **timings,
+                "modelLoadMs": sum(entry["wallMs"] for entry in timings.get("modelLoad", {}).values()),
+                "inferenceMs": sum(entry["wallMs"] for entry in timings.get("inference", {}).values()),
+                "peakRssMb": peak_rss_mb(),
+                "preparePeakRssMb": page.get("preparePeakRssMb"),
+            }
+        )
+    if cache is not None:
+        store_cached_page(cache, page)
+        payload["cache"] = {"hit": bool(page.get("cached")), "hits": cache.hits, "misses": cache.misses}
+    return payload
+
+
+def build_payload(image_path, env=None, config=None, runtime=None):
+    if config is None:
+        config = load_config(env)
+    owns_runtime = runtime is None
+    if owns_runtime:
+        runtime = {}
+    profiler = start_profiler(config)
+    try:
+        cache = get_result_cache(config)
+        key, page = lookup_cached_page(cache, image_path, config)
+        if page is None:
+            page = prepare_page(image_path, config)
+            page["cacheKey"] = key
+        recognize_pages([page], config, runtime)
+        return finish_page(page, config, cache)
+    finally:
+        if owns_runtime:
+            restore_torch_threads(runtime)
+        dump_profiler(profiler, config, "page")
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+
+def natural_key(value):
+    parts = []
+    for chunk in re.split(r"(\d+)", value):
+        parts.append((0, int(chunk), "") if chunk.isdigit() else (1, 0, chunk.lower()))
+    return parts
+
+
+def expand_image_paths(paths, pdf_dpi=300):
+    # Directories (e.g. pdftoppm output) expand to their images in page order, PDFs to their pages.
+    expanded = []
+    for path in paths:
+        if is_pdf(path):
+            expanded.extend(pdf_page_refs(path, pdf_dpi))
+        elif isinstance(path, str) and os.path.isdir(path):
+            names = [name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)]
+            expanded.extend(os.path.join(path, name) for name in sorted(names, key=natural_key))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+_PREPARE_POOL = {}
+
+
+def get_prepare_pool(workers):
+    # Spawned (not forked) so workers never inherit torch/paddle thread state; reused by --serve across batches.
+    pool = _PREPARE_POOL.get(workers)
+    if pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _PREPARE_POOL[workers] = pool
+    return pool
+
+
+def configure_torch_threads(config, engines, pooled=False):
+    # Returns the thread count it replaced, if any, so a request can hand the process setting back.
+    if not any(name in engines for name in ("trocr", "trocr-onnx")):
+        return None
+    threads = config["torch_threads"]
+    if not threads and pooled:
+        # Leave the cores the preprocessing workers are using to them.
+        threads = max(1, (os.cpu_count() or 1) - config["workers"])
+    if not threads:
+        return None
+    import torch
+
+    previous = torch.get_num_threads()
+    torch.set_num_threads(threads)
+    return previous
+
+
+def restore_torch_threads(runtime):
+    previous = runtime.pop("torch_threads", None)
+    if previous:
+        import torch
+
+        torch.set_num_threads(previous)
+
+
+def prepare_pooled_page(image_path, config):
+    # Pool workers outlive the batch under --serve; an open PdfDocument would keep the upload (and the
+    # spooled copy) locked on Windows, so each job releases it before returning.
+    try:
+        return prepare_page(image_path, config)
+    finally:
+        close_pdf_document()
+
+
+def iter_prepared(paths, config, cache=None):
+    # Yields (index, source, page, error) in input order. Cache hits skip preparation entirely;
+    # misses are prepared in the process pool when one is configured.
+    workers = config["workers"]
+    pool = get_prepare_pool(workers) if workers > 1 and len(paths) > 1 else None
+    # Bounded look-ahead keeps at most two prepared pages per worker waiting for recognition.
+    look_ahead = workers * 2 if pool else 1
+
+    def start(index, image_path):
+        key, page = lookup_cached_page(cache, image_path, config)
+        future = None
+        if page is None and pool is not None:
+            future = pool.submit(prepare_pooled_page, image_path, config)
+        return index, image_path, key, page, future
+
+    in_flight = deque()
+    upcoming = iter(enumerate(paths))
+    for index, image_path in upcoming:
+        in_flight.append(start(index, image_path))
+        if len(in_flight) >= look_ahead:
+            break
+    while in_flight:
+        index, image_path, key, page, future = in_flight.popleft()
+        source = image_source(image_path, index)
+        error = None
+        try:
+            if page is None:
+                page = future.result() if future is not None else prepare_page(image_path, config)
+                page["cacheKey"] = key
+        except Exception as exc:
+            page, error = None, str(exc)
+        for next_index, next_path in upcoming:
+            in_flight.append(start(next_index, next_path))
+            break
+        yield index, source, page, error
+
+
+def iter_batch(paths, env=None):
+    config = load_config(env)
+    cache = get_result_cache(config)
+    paths = expand_image_paths(paths, config["pdf_dpi"])
+    runtime = {"pooled": config["workers"] > 1 and len(paths) > 1}
+    window = []
+    pending_crops = 0
+
+    def flush():
+        pages = [page for _, _, page, _ in window if page is not None]
+        try:
+            recognize_pages(pages, config, runtime)
+        except Exception as exc:
+            for page in pages:
+                page["errors"].append(f"recognize: {exc}")
+        for index, source, page, error in window:
+            if page is None:
+                payload = {"error": error, "lines": []}
+            else:
+                payload = finish_page(page, config, cache)
+            yield {"type": "result", "index": index, "source": source, "payload": payload}
+
+    profiler = start_profiler(config)
+    try:
+        # Pages are grouped until they fill one TrOCR batch, then recognized and streamed in input order.
+        for index, source, page, error in iter_prepared(paths, config, cache):
+            window.append((index, source, page, error))
+            if page is not None:
+                pending_crops += sum(1 for check in page_checks(page) for key in check["crops"] if key != "micr")
+            if pending_crops >= config["trocr_batch_size"]:
+                yield from flush()
+                window = []
+                pending_crops = 0
+        if window:
+            yield from flush()
+    finally:
+        restore_torch_threads(runtime)
+        dump_profiler(profiler, config, "batch")
+        close_pdf_document()
+        for spooled in {ref["pdf"] for ref in paths if is_pdf_page(ref) and ref["spooled"]}:
+            try:
+                os.remove(spooled)
+            except OSError:
+                pass
+
+
+def run_batch(paths, stream_out=None, env=None):
+    stream_out = stream_out or sys.stdout
+    count = 0
+    for message in iter_batch(paths, env):
+        write_message(stream_out, message)
+        count += 1
+    write_message(stream_out, {"type": "done", "count": count})
+
+
+def request_env(request):
+    # Per-request overrides use the same OCR_* names the one-shot CLI reads from the environment.
+    env = dict(os.environ)
+    for key, value in (request.get("env") or {}).items():
+        env[str(key)] = "" if value is None else str(value)
+    return env
+
+
+def read_attached_images(stream, sizes):
+    # Raw encoded images follow their request line back to back, one per entry in `sizes`.
+    images = []
+    for size in sizes:
+        data = stream.read(int(size))
+        if len(data) != int(size):
+            raise EOFError("truncated image data")
+        images.append(data)
+    return images
+
+
+def write_message(stream, message):
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+
+def serve(stream_in=None, stream_out=None):
+    # Binary input: a request line may be followed by the raw image bytes it announces.
+    stream_in = stream_in or sys.stdin.buffer
+    stream_out = stream_out or sys.stdout
+    # Libraries occasionally print to stdout; keep the protocol stream clean.
+    sys.stdout = sys.stderr
+    started = time.time()
+    served = 0
+
+    config = load_config()
+    preload = [name for name in json.loads(os.environ.get("OCR_SERVE_PRELOAD") or "[]") if name]
+    preloaded = {}
+    for model_name in preload:
+        try:
+            # Same options as a request would use, so the first request reuses the preloaded engine.
+            preloaded["trocr"] = get_engine("trocr", **engine_options("trocr", {**config, "model_name": model_name}))
+        except Exception as exc:
+            write_message(stream_out, {"type": "error", "error": f"trocr: {exc}"})
+    configure_torch_threads(config, preloaded)
+
+    write_message(stream_out, {"type": "ready", "pid": os.getpid(), "models": loaded_engines()})
+    for line in iter(stream_in.readline, b""):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as exc:
+            write_message(stream_out, {"type": "error", "error": f"invalid request: {exc}"})
+            continue
+        request_id = request.get("id")
+        kind = request.get("type") or "ocr"
+        if kind == "health":
+            write_message(
+                stream_out,
+                {
+                    "id": request_id,
+                    "type": "health",
+                    "ok": True,
+                    "pid": os.getpid(),
+                    "uptime": round(time.time() - started, 3),
+                    "served": served,
+                    "models": loaded_engines(),
+                },
+            )
+        elif kind == "shutdown":
+            write_message(stream_out, {"id": request_id, "type": "shutdown"})
+            break
+        elif kind == "ocr":
+            try:
+                if "imageBytes" in request:
+                    image = read_attached_images(stream_in, [request["imageBytes"]])[0]
+                else:
+                    image = request["image"]
+                payload = build_payload(image, request_env(request))
+            except Exception as exc:
+                payload = {"error": str(exc), "lines": []}
+            served += 1
+            write_message(stream_out, {"id": request_id, "type": "result", "payload": payload})
+        elif kind == "batch":
+            count = 0
+            try:
+                if "imageSizes" in request:
+                    images = read_attached_images(stream_in, request["imageSizes"])
+                else:
+                    images = request.get("images") or []
+                for message in iter_batch(images, request_env(request)):
+                    served += 1
+                    count += 1
+                    write_message(stream_out, {"id": request_id, **message})
+            except Exception as exc:
+                write_message(stream_out, {"id": request_id, "type": "error", "error": str(exc)})
+                continue
+            write_message(stream_out, {"id": request_id, "type": "done", "count": count})
+        else:
+            write_message(stream_out, {"id": request_id, "type": "error", "error": f"unknown request type: {kind}"})
+
+
+def module_available(*names):
+    # find_spec only locates the package; nothing heavy is imported.
+    return all(importlib.util.find_spec(name) is not None for name in names)
+
+
+def package_version(name):
+    from importlib import metadata
+
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def probe(env=None):
+    env = os.environ if env is None else env
+    tesseract_cli = shutil.which("tesseract")
+    has_tesserocr = module_available("tesserocr")
+    return {
+        "version": __version__,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pillow": package_version("pillow"),
+        "engines": {
+            "trocr": {
+                "available": module_available("torch", "transformers"),
+                "torch": package_version("torch"),
+                "transformers": package_version("transformers"),
+            },
+            "trocr-onnx": {
+                "available": module_available("torch", "transformers"),
+                "backend": "onnx" if module_available("optimum", "onnxruntime") else "int8",
+                "onnxruntime": package_version("onnxruntime"),
+                "optimum": package_version("optimum"),
+            },
+            "paddle": {
+                "available": module_available("paddleocr"),
+                "paddleocr": package_version("paddleocr"),
+            },
+            "tesseract": {
+                "available": bool(tesseract_cli) or has_tesserocr,
+                "binding": "tesserocr" if has_tesserocr else ("cli" if tesseract_cli else None),
+                "path": tesseract_cli,
+            },
+        },
+        "cacheDir": load_config(env)["cache_dir"],
+        "modelSnapshots": list_model_snapshots(model_snapshot_root(env)),
+        "workers": parse_worker_count(env.get("OCR_WORKERS")),
+    }
+
+
+def list_model_snapshots(root):
+    snapshots = []
+    try:
+        names = sorted(os.listdir(root))
+    except OSError:
+        return snapshots
+    for name in names:
+        try:
+            with open(os.path.join(root, name, "snapshot.json"), "r", encoding="utf-8") as handle:
+                model_name = json.load(handle).get("model")
+        except (OSError, ValueError):
+            continue
+        if not model_name:
+            continue
+        path, manifest, state = read_model_snapshot(model_name, root)
+        snapshots.append({"model": model_name, "path": path, "state": state, "created": (manifest or {}).get("created")})
+    return snapshots
+
+
+def prepare_models(model_names, env=None):
+    env = os.environ if env is None else env
+    root = model_snapshot_root(env)
+    results = []
+    for model_name in model_names or [load_config(env)["model_name"]]:
+        try:
+            results.append(prepare_model_snapshot(model_name, root))
+        except Exception as exc:
+            results.append({"model": model_name, "error": str(exc)})
+    return {"root": root, "snapshots": results}
+
+
 def main():
     warnings.filterwarnings("ignore")
+    if len(sys.argv) >= 2 and sys.argv[1] == "--version":
+        print(json.dumps({"version": __version__}))
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "--probe":
+        print(json.dumps(probe()))
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "--prepare-model":
+        sys.stdout, protocol_out = sys.stderr, sys.stdout
+        result = prepare_models(sys.argv[2:])
+        print(json.dumps(result), file=protocol_out)
+        if any("error" in item for item in result["snapshots"]):
+            sys.exit(1)
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "--serve":
+        serve()
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "--batch":
+        sys.stdout, protocol_out = sys.stderr, sys.stdout
+        run_batch(sys.argv[2:], protocol_out)
+        return
     if len(sys.argv) < 2:
-        print(json.dumps({"error": "Usage: handwriting_ocr.py <image_path>", "lines": []}))
+        print(json.dumps({"error": "Usage: handwriting_ocr.py <image_path|pdf> | --batch <image_path|dir|pdf>... | --serve | --probe | --prepare-model [model]... | --version", "lines": []}))
         return
 
     image_path = sys.argv[1]
+    if is_pdf(image_path):
+        # A PDF is a batch of pages; results stream one line per page like --batch.
+        sys.stdout, protocol_out = sys.stderr, sys.stdout
+        run_batch([image_path], protocol_out)
+        return
     try:
         payload = build_payload(image_path)
     except Exception as exc:
@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handwriting_ocr  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "text, value",
+    [
+        ("12.50", 12.5),
+        ("12.5", 12.5),
+        ("$ 45", 45.0),
+        ("1,234", 1234.0),
+        ("1,234.56", 1234.56),
+        ("1.234,56", 1234.56),
+        ("12,50", 12.5),
+        ("l2O.5O", 120.5),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_numeric_amount(text, value):
+    assert handwriting_ocr.parse_numeric_amount(text) == value
+
+
+@pytest.mark.parametrize(
+    "text, value",
+    [
+        ("Twenty-five and 50/100", 25.5),
+        ("One thousand two hundred thirty four and 56/100", 1234.56),
+        ("One hundred only", 100.0),
+        ("Ten dollars even", 10.0),
+        ("Exactly forty two dollars", 42.0),
+        ("Five hundred and no/100", 500.0),
+        ("Ninty nine", 99.0),
+        ("seventy thre and 00/100", 73.0),
+        ("", None),
+    ],
+)
+def test_parse_legal_amount(text, value):
+    assert handwriting_ocr.parse_legal_amount(text) == value
+
+
+def test_find_amount_pair_prefers_first_consistent_option():
+    numeric = [("trocr", "12.5"), ("paddle", "125.00")]
+    legal = [("trocr", "One hundred twenty five only"), ("paddle", "Twelve and 50/100")]
+    assert handwriting_ocr.find_amount_pair(numeric, legal) == (("trocr", "12.5"), ("paddle", "Twelve and 50/100"), 12.5)
+
+
+class FakeTrocr:
+    def __init__(self, readings):
+        self.readings = readings
+        self.calls = []
+
+    def recognize(self, crops, batch_size=None, scores=False, profiles=None):
+        return [(self.readings[crop.info["id"]][0], 0.9) for crop in crops]
+
+    def alternatives(self, crops, count, profiles=None, batch_size=None):
+        self.calls.append(len(crops))
+        return [[(text, 0.5) for text in self.readings[crop.info["id"]][1:]] for crop in crops]
+
+
+def fake_page(numeric, legal):
+    crops = {}
+    for key, name in (("numericAmount", numeric), ("legalAmount", legal)):
+        crops[key] = Image.new("L", (8, 8))
+        crops[key].info["id"] = name
+    return {"crops": crops, "candidates": {key: {} for key in crops}, "confidences": {key: {} for key in crops}, "errors": []}
+
+
+def test_reconcile_batches_rereads_and_reports_the_winning_score():
+    config = handwriting_ocr.load_config({"OCR_CACHE": "0"})
+    engine = FakeTrocr(
+        {
+            "n1": ["12.00", "12.00"],
+            "l1": ["Twelve and 00/100", "Twelve and 00/100"],
+            "n2": ["7.00", "1.00"],
+            "l2": ["One and 00/100", "One and 00/100"],
+            "n3": ["40.00", "40.00"],
+            "l3": ["Fourteen and 00/100", "Forty and 00/100"],
+        }
+    )
+    pages = [fake_page("n1", "l1"), fake_page("n2", "l2"), fake_page("n3", "l3")]
+    for page in pages:
+        for key, crop in page["crops"].items():
+            page["candidates"][key]["trocr"], page["confidences"][key]["trocr"] = engine.recognize([crop])[0]
+
+    handwriting_ocr.reconcile_amounts(pages, {"trocr": engine}, config)
+
+    # Both mismatched pages re-read their numeric amount in one batch; only the third needs a second round.
+    assert engine.calls == [2, 1]
+    assert pages[0]["amountCheck"]["retried"] == []
+    assert pages[0]["amountCheck"]["numericAmount"] == ["trocr", "12.00", 0.9]
+    assert pages[1]["amountCheck"]["value"] == 1.0
+    assert pages[1]["amountCheck"]["numericAmount"] == ["trocr", "1.00", 0.5]
+    assert pages[1]["amountCheck"]["legalAmount"] == ["trocr", "One and 00/100", 0.9]
+    assert pages[2]["amountCheck"]["retried"] == ["numericAmount", "legalAmount"]
+    assert pages[2]["amountCheck"]["legalAmount"] == ["trocr", "Forty and 00/100", 0.5]
+
+
+def test_list_charset_in_regions_is_normalized():
+    raw = json.dumps({"numericAmount": {"xMin": 0.7, "xMax": 0.96, "yMin": 0.5, "yMax": 0.7, "charset": ["digits", "$", ".", "."]}})
+    regions = handwriting_ocr.load_regions({"OCR_REGIONS": raw})
+    assert regions["numericAmount"]["charset"] == "0123456789 $."
+    assert regions["checkNumber"] == handwriting_ocr.DEFAULT_REGIONS["checkNumber"]
+    profile = handwriting_ocr.generation_profile({"regions": regions}, "numericAmount")
+    assert {profile: True}[profile]
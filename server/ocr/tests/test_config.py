@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handwriting_ocr  # noqa: E402
+
+
+def test_model_snapshot_dir_follows_request_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("OCR_MODEL_DIR", str(tmp_path / "process"))
+    config = handwriting_ocr.load_config({"OCR_MODEL_DIR": str(tmp_path / "request")})
+    assert config["model_dir"] == str(tmp_path / "request")
+    assert handwriting_ocr.engine_options("trocr", config)["model_dir"] == str(tmp_path / "request")
+    assert handwriting_ocr.engine_options("trocr-onnx", config)["model_dir"] == str(tmp_path / "request")
+
+    config = handwriting_ocr.load_config({"OCR_CACHE_DIR": str(tmp_path / "cache")})
+    assert config["model_dir"] == os.path.join(str(tmp_path / "cache"), "models")
+
+    config = handwriting_ocr.load_config({"OCR_MODEL_DIR": str(tmp_path / "request"), "OCR_MODEL_SNAPSHOT": "0"})
+    assert config["model_dir"] is None
+
+
+def test_prepare_models_uses_passed_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("OCR_MODEL_DIR", str(tmp_path / "process"))
+    monkeypatch.setattr(handwriting_ocr, "prepare_model_snapshot", lambda model_name, root: {"model": model_name, "path": root})
+    result = handwriting_ocr.prepare_models(["some/model"], {"OCR_MODEL_DIR": str(tmp_path / "request")})
+    assert result["root"] == str(tmp_path / "request")
+    assert result["snapshots"] == [{"model": "some/model", "path": str(tmp_path / "request")}]
+
+
+def test_probe_reports_configured_cache_dir(tmp_path):
+    result = handwriting_ocr.probe({"OCR_CACHE_DIR": str(tmp_path / "cache")})
+    assert result["cacheDir"] == str(tmp_path / "cache")
+    assert result["modelSnapshots"] == []
@@ -0,0 +1,45 @@
+import json
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+OCR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, OCR_DIR)
+sys.path.insert(0, os.path.join(OCR_DIR, "bench"))
+
+import handwriting_ocr  # noqa: E402
+from synth import generate_set  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def check(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("checks"))
+    manifest = generate_set(directory, 1, seed=0)
+    return Image.open(os.path.join(directory, manifest["checks"][0]["file"])).convert("L")
+
+
+def layout_rows(config):
+    store = handwriting_ocr.get_layout_store(config)
+    return {row[0]: json.loads(row[1]) for row in store.db.execute("SELECT id, geometry FROM layouts")}
+
+
+def test_page_without_structure_is_not_learned(tmp_path):
+    config = handwriting_ocr.load_config({"OCR_CACHE_DIR": str(tmp_path), "OCR_LAYOUTS": "1"})
+    result = handwriting_ocr.prepare_check(Image.new("L", (1200, 540), 255), config, None)
+    assert result["layout"] == {"id": None, "hit": False}
+    assert layout_rows(config) == {}
+
+
+def test_replay_without_ink_is_searched_and_overwritten(tmp_path, check):
+    config = handwriting_ocr.load_config({"OCR_CACHE_DIR": str(tmp_path), "OCR_LAYOUTS": "1"})
+    learned = handwriting_ocr.prepare_check(check, config, None)["layout"]["id"]
+    geometry = layout_rows(config)[learned]
+
+    # Put the numeric box edge in the blank padding right of the amount box, as a layout learned from
+    # another check could; replaying it leaves an empty crop.
+    handwriting_ocr.get_layout_store(config).relearn(learned, {**geometry, "numericAmount": {"left": 0.9565}})
+    replayed = handwriting_ocr.prepare_check(check, config, None)
+    assert replayed["layout"] == {"id": learned, "hit": True}
+    assert layout_rows(config)[learned] == geometry
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+OCR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, OCR_DIR)
+sys.path.insert(0, os.path.join(OCR_DIR, "bench"))
+
+import handwriting_ocr  # noqa: E402
+from synth import generate_set  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def checks(tmp_path_factory):
+    # Seed 0 includes checks whose borderless crops used to split into a check plus a tiny phantom piece.
+    directory = str(tmp_path_factory.mktemp("checks"))
+    manifest = generate_set(directory, 16, seed=0)
+    return [Image.open(os.path.join(directory, item["file"])).convert("L") for item in manifest["checks"]]
+
+
+def borderless(image):
+    return image.crop((30, 30, image.width - 30, image.height - 30))
+
+
+def letter_page(images, page_number=False):
+    page = Image.new("L", (2550, 3300), 255)
+    top = 150
+    for image in images:
+        page.paste(image, (300, top))
+        top += image.height + 120
+    if page_number:
+        draw = ImageDraw.Draw(page)
+        draw.rectangle((2180, 3130, 2330, 3225), outline=0, width=3)
+        draw.text((2220, 3160), "p. 1", fill=0)
+    return np.asarray(page)
+
+
+def test_single_checks_are_not_split(checks):
+    for image in checks:
+        assert handwriting_ocr.find_check_rects(np.asarray(image)) == []
+        assert handwriting_ocr.find_check_rects(np.asarray(borderless(image))) == []
+
+
+def test_page_number_box_is_not_a_check(checks):
+    assert handwriting_ocr.find_check_rects(letter_page(checks[:1], page_number=True)) == []
+    assert len(handwriting_ocr.find_check_rects(letter_page(checks[:3], page_number=True))) == 3
+
+
+def test_stacked_checks_in_reading_order(checks):
+    rects = handwriting_ocr.find_check_rects(letter_page(checks[:3]))
+    assert len(rects) == 3
+    top = 150
+    for (x0, y0, x1, y1), image in zip(rects, checks[:3]):
+        assert x0 <= 300 and x1 >= 300 + image.width
+        assert y0 <= top and y1 >= top + image.height
+        top += image.height + 120
+
+
+def test_borderless_grid(checks):
+    page = Image.new("L", (4000, 2000), 250)
+    for index, image in enumerate(checks[4:8]):
+        page.paste(borderless(image), (100 + (index % 2) * 1950, 100 + (index // 2) * 950))
+    rects = handwriting_ocr.find_check_rects(np.asarray(page))
+    assert len(rects) == 4
+    assert [rect[0] < 2000 for rect in rects] == [True, False, True, False]
+    assert [rect[1] < 1000 for rect in rects] == [True, True, False, False]